@@ -0,0 +1,104 @@
+# filename: acu_pi/audio_ring.py
+# Microphone capture for the ACU. PortAudio's callback copies every block
+# into a preallocated ring of fixed-size frames; wake-word detection, VAD and
+# streaming read frames out of the ring at their own pace. A slow network
+# send or decoder step therefore delays processing but never loses audio,
+# and the last few seconds are always available for pre-roll.
+
+import threading
+import time
+
+import numpy as np
+
+from metrics import REGISTRY
+
+overflows = REGISTRY.counter("acu_capture_overflows_total", "Blocks PortAudio reported as overflowed before they reached the ring.")
+dropped_frames = REGISTRY.counter("acu_ring_dropped_frames_total", "Frames overwritten before the reader got to them.")
+read_latency = REGISTRY.gauge("acu_ring_read_latency_seconds", "Time between capturing a frame and reading it (last frame).")
+max_read_latency = REGISTRY.gauge("acu_ring_read_latency_max_seconds", "Largest capture-to-read delay since startup.")
+
+class AudioRing:
+    """
+    A ring of `capacity` frames of `frame_samples` int16 samples. There is a
+    single writer (the audio callback) and the writer never waits: it only
+    stores the frame and advances a counter. Frames are addressed by their
+    absolute index, so readers can tell how far behind they are and can go
+    back to earlier frames that haven't been overwritten yet.
+    """
+
+    def __init__(self, frame_samples, seconds=10.0, sample_rate=16000):
+        self.frame_samples = frame_samples
+        self.capacity = int(seconds * sample_rate / frame_samples)
+        self.frames = np.zeros((self.capacity, frame_samples), dtype=np.int16)
+        self.captured_at = np.zeros(self.capacity, dtype=np.float64)
+        self.written = 0        # Absolute index of the next frame to write
+        self.partial = 0        # Samples already in the frame being filled
+        self.max_latency = 0.0
+        self.overflow_count = 0
+        self.dropped_count = 0
+        self.data_ready = threading.Event()
+        read_latency.set(0.0)
+        max_read_latency.set_function(lambda: self.max_latency)
+
+    # --- Writer side (PortAudio thread) ---
+    def callback(self, indata, frame_count, time_info, status):
+        """sounddevice InputStream callback."""
+        if status.input_overflow:
+            self.overflow_count += 1
+            overflows.inc()
+        samples = indata[:, 0]
+        offset = 0
+        while offset < len(samples):
+            slot = self.written % self.capacity
+            take = min(self.frame_samples - self.partial, len(samples) - offset)
+            self.frames[slot, self.partial:self.partial + take] = samples[offset:offset + take]
+            self.partial += take
+            offset += take
+            if self.partial == self.frame_samples:
+                self.captured_at[slot] = time.monotonic()
+                self.partial = 0
+                self.written += 1  # Publish the frame only once it is complete
+        self.data_ready.set()
+
+    # --- Reader side ---
+    def oldest(self):
+        """Index of the oldest frame still held intact."""
+        # The slot after the newest frame is the one the callback is filling next.
+        return max(0, self.written - self.capacity + 1)
+
+    def view(self, index):
+        """Zero-copy, read-only bytes view of frame `index` (valid until it is overwritten)."""
+        return memoryview(self.frames[index % self.capacity]).toreadonly().cast('B')
+
+    def reader(self, start=None):
+        return RingReader(self, self.written if start is None else start)
+
+class RingReader:
+    """A cursor over an AudioRing that yields frames in order, waiting for new ones."""
+
+    def __init__(self, ring, position):
+        self.ring = ring
+        self.position = position
+
+    def read(self):
+        """Returns (index, view) of the next frame, blocking until it has been captured."""
+        ring = self.ring
+        while self.position >= ring.written:
+            ring.data_ready.wait(0.5)
+            ring.data_ready.clear()
+        if self.position < ring.oldest():
+            # Fell more than a ring behind; skip to the oldest frame still held.
+            ring.dropped_count += ring.oldest() - self.position
+            dropped_frames.inc(ring.oldest() - self.position)
+            self.position = ring.oldest()
+        index = self.position
+        self.position += 1
+        latency = time.monotonic() - ring.captured_at[index % ring.capacity]
+        read_latency.set(latency)
+        ring.max_latency = max(ring.max_latency, latency)
+        return index, ring.view(index)
+
+    def frames(self, start, end):
+        """Views of the frames in [start, end) that are still held, e.g. for pre-roll."""
+        start = max(start, self.ring.oldest())
+        return [self.ring.view(index) for index in range(start, min(end, self.ring.written))]
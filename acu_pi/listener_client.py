@@ -4,17 +4,23 @@ import sounddevice as sd
 from pocketsphinx import Config, Decoder
 import webrtcvad
 import numpy as np
-import collections
 import sys
 import os
+import socket
 import pocketsphinx
 
 # --- Add protos directory to path ---
 PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
 sys.path.append(os.path.join(PROJECT_ROOT, 'protos'))
+sys.path.append(os.path.join(PROJECT_ROOT, 'common'))
 
 import audiostream_pb2
 import audiostream_pb2_grpc
+from audio_codec import OpusFrameEncoder, opus_available
+from metrics import REGISTRY, start_metrics_server
+from tracing import Trace
+from audio_ring import AudioRing
+from speech_detector import SPEECH, SpeechDetector
 
 # --- Configuration ---
 BRAIN_ADDRESS = 'rdunano2:50051'
@@ -22,9 +28,176 @@ SAMPLE_RATE = 16000
 CHUNK_DURATION_MS = 30
 CHUNK_SIZE = int(SAMPLE_RATE * CHUNK_DURATION_MS / 1000)
 VAD_AGGRESSIVENESS = 1
-SILENCE_CHUNKS_TRIGGER = 50
 PRE_SPEECH_BUFFER_CHUNKS = 10
+# Smoothed VAD: speech starts when 3 of the last 5 frames are speech and ends
+# when 90% of the last 20 frames (600 ms) are silence.
+SPEECH_START_CHUNKS = 3
+SPEECH_START_WINDOW = 5
+SPEECH_END_WINDOW = 20
+SPEECH_END_RATIO = 0.9
+NO_SPEECH_TIMEOUT_CHUNKS = 100  # Give up if no speech starts within 3 s of the wake word
 WAKE_WORD = "bridge to engineering"
+# Identifies this unit to the Brain so each room keeps its own conversation.
+ACU_ID = os.getenv("ACU_ID", socket.gethostname())
+CALL_METADATA = (('x-acu-id', ACU_ID),)
+# When True, use the Converse RPC and play the reply on this unit's speaker
+# instead of the Brain's.
+PLAY_REPLY_ON_ACU = False
+# "opus" compresses the microphone stream when both sides have opuslib; "pcm" never does.
+AUDIO_CODEC = os.getenv("ACU_AUDIO_CODEC", "opus")
+FRAMES_PER_MESSAGE = 3  # 30 ms frames per AudioChunk message (3 = 90 ms)
+STARTUP_PROBE_SECONDS = 10
+RING_SECONDS = 10      # Microphone history kept in memory
+METRICS_PORT = 9103    # Capture counters at http://<acu>:9103/metrics
+CHANNEL_OPTIONS = [
+    ('grpc.keepalive_time_ms', 20000),           # Ping an idle connection every 20 s
+    ('grpc.keepalive_timeout_ms', 5000),         # and drop it if the ping isn't answered in 5 s
+    ('grpc.keepalive_permit_without_calls', 1),  # Most of the time there is no active call
+    ('grpc.http2.max_pings_without_data', 0),
+    ('grpc.initial_reconnect_backoff_ms', 250),
+    ('grpc.min_reconnect_backoff_ms', 250),
+    ('grpc.max_reconnect_backoff_ms', 5000),
+]
+
+wake_to_first_audio = REGISTRY.histogram("acu_wake_to_first_audio_seconds", "Wake word to the first reply audio from the Brain (Converse).")
+wake_to_receipt = REGISTRY.histogram("acu_wake_to_receipt_seconds", "Wake word to the Brain accepting the command (StreamAudio).")
+
+class BrainConnection:
+    """
+    One long-lived channel to the Brain, opened at startup and shared by every
+    command, so name lookup and TCP/HTTP2 setup never happen after the wake
+    word. Keepalive pings keep NAT/Wi-Fi paths open and detect a dead Brain;
+    gRPC reconnects in the background with backoff, and calls made while it
+    is reconnecting wait for the channel instead of failing.
+    """
+
+    def __init__(self, address):
+        self.address = address
+        self.channel = grpc.insecure_channel(address, options=CHANNEL_OPTIONS)
+        self.stub = audiostream_pb2_grpc.AudioStreamerStub(self.channel)
+        self.state = None
+        self.negotiated_codec = None
+        self.channel.subscribe(self._on_state_change, try_to_connect=True)
+
+    def _on_state_change(self, state):
+        if state != self.state:
+            print(f"Brain connection: {state.name}")
+        if state == grpc.ChannelConnectivity.TRANSIENT_FAILURE:
+            self.negotiated_codec = None  # The Brain may come back as a different build
+        self.state = state
+
+    def wait_until_ready(self, timeout=STARTUP_PROBE_SECONDS):
+        """Startup readiness probe. Returns False (and keeps reconnecting) if the Brain isn't up yet."""
+        try:
+            grpc.channel_ready_future(self.channel).result(timeout=timeout)
+        except grpc.FutureTimeoutError:
+            print(f"Brain at {self.address} is not reachable yet; will keep trying in the background.")
+            return False
+        print(f"Connected to the Brain at {self.address}.")
+        self.codec()
+        return True
+
+    def codec(self):
+        """Picks Opus if this unit and the Brain both support it, else raw PCM. Asked once per connection."""
+        if self.negotiated_codec is None:
+            self.negotiated_codec = self._negotiate()
+        return self.negotiated_codec
+
+    def _negotiate(self):
+        if AUDIO_CODEC != "opus" or not opus_available():
+            return audiostream_pb2.PCM_S16LE
+        try:
+            capabilities = self.stub.GetCapabilities(audiostream_pb2.CapabilitiesRequest(), timeout=2.0)
+        except grpc.RpcError as e:
+            print(f"Could not get the Brain's capabilities, sending PCM: {e.code()}")
+            return audiostream_pb2.PCM_S16LE
+        if audiostream_pb2.OPUS in capabilities.codecs:
+            return audiostream_pb2.OPUS
+        return audiostream_pb2.PCM_S16LE
+
+class AudioChunkPacker:
+    """
+    Groups 30 ms PCM frames into AudioChunk messages, encoding them with the
+    chosen codec. Each message is marked VAD_SPEECH if any of its frames
+    was speech and VAD_SILENCE otherwise, so the Brain can skip decoding the
+    pauses. start() flags the next message as the start of a segment and
+    flush(end=True) flags the last one as the end of the command.
+    """
+
+    def __init__(self, codec, frames_per_message=FRAMES_PER_MESSAGE):
+        self.codec = codec
+        self.frames_per_message = frames_per_message
+        self.frames = []
+        self.speech = False
+        self.start_pending = False
+        self.encoder = OpusFrameEncoder(SAMPLE_RATE) if codec == audiostream_pb2.OPUS else None
+
+    def _message(self, pcm, end=False):
+        vad = audiostream_pb2.VAD_SPEECH if self.speech else audiostream_pb2.VAD_SILENCE
+        message = audiostream_pb2.AudioChunk(codec=self.codec, vad=vad,
+                                             speech_start=self.start_pending, speech_end=end)
+        self.speech = False
+        self.start_pending = False
+        if self.encoder:
+            message.opus_packets.extend(self.encoder.encode(pcm))
+            if end:
+                message.opus_packets.extend(self.encoder.flush())
+        else:
+            message.audio_chunk = pcm
+        return message
+
+    def start(self):
+        self.start_pending = True
+
+    def add(self, frame, is_speech=True):
+        """Queues a frame; returns the messages that are ready to send."""
+        self.frames.append(frame)
+        self.speech = self.speech or is_speech
+        if len(self.frames) < self.frames_per_message:
+            return []
+        pcm = b"".join(self.frames)
+        self.frames = []
+        return [self._message(pcm)]
+
+    def flush(self, end=False):
+        """Packs whatever frames are left; with end=True always returns the closing message."""
+        if not self.frames and not end:
+            return []
+        pcm = b"".join(self.frames)
+        self.frames = []
+        return [self._message(pcm, end)]
+
+def play_server_events(events, stop_sending, trace):
+    """Consumes Converse events: prints transcripts and plays reply audio frames."""
+    State = audiostream_pb2.StatusEvent
+    out = None
+    try:
+        for event in events:
+            kind = event.WhichOneof('event')
+            if kind == 'transcript':
+                label = "Heard" if event.transcript.is_final else "Hearing"
+                print(f"{label}: '{event.transcript.text}'")
+            elif kind == 'status':
+                if event.status.state == State.ENDPOINT_DETECTED:
+                    stop_sending()
+                elif event.status.state == State.ERROR:
+                    print(f"Brain reported an error: {event.status.message}")
+                elif event.status.state == State.DONE:
+                    print("Server response: 'Conversation complete.'")
+            elif kind == 'audio':
+                if trace.mark("first_audio"):
+                    wake_to_first_audio.observe(trace.elapsed("start", "first_audio"))
+                if out is None or out.samplerate != event.audio.sample_rate:
+                    if out is not None:
+                        out.stop()  # let buffered audio finish before switching rates
+                        out.close()
+                    out = sd.RawOutputStream(samplerate=event.audio.sample_rate, channels=1, dtype='int16')
+                    out.start()
+                out.write(event.audio.pcm)
+    finally:
+        if out is not None:
+            out.stop()
+            out.close()
 
 def main():
     """Main loop: opens one audio stream and uses a state machine
@@ -41,79 +214,99 @@ def main():
     vad = webrtcvad.Vad(VAD_AGGRESSIVENESS)
     
     listening_for_command = False
+
+    print(f"Connecting to the Brain at {BRAIN_ADDRESS}...")
+    brain = BrainConnection(BRAIN_ADDRESS)
+    brain.wait_until_ready()
+    start_metrics_server(METRICS_PORT)
     
     try:
-        with sd.InputStream(samplerate=SAMPLE_RATE, channels=1, dtype='int16', blocksize=CHUNK_SIZE) as stream:
+        # Capture runs in PortAudio's callback; this loop only reads from the ring.
+        ring = AudioRing(CHUNK_SIZE, RING_SECONDS, SAMPLE_RATE)
+        with sd.InputStream(samplerate=SAMPLE_RATE, channels=1, dtype='int16', blocksize=CHUNK_SIZE,
+                            callback=ring.callback):
             print(f"✅ ACU is running. Waiting for '{WAKE_WORD}'...")
             decoder.start_utt() # Start the utterance ONCE
+            cursor = ring.reader()
             
             while True:
-                chunk, overflowed = stream.read(CHUNK_SIZE)
-                chunk_bytes = chunk.tobytes()
+                wake_index, chunk_bytes = cursor.read()
 
                 if not listening_for_command:
                     decoder.process_raw(chunk_bytes, False, False)
                     if decoder.hyp() is not None:
-                        print(f"✅ Wake word detected!")
+                        # The trace id and wake time travel with the command to the Brain and TTS server.
+                        trace = Trace()
+                        metadata = CALL_METADATA + trace.metadata()
+                        print(f"✅ Wake word detected! (request {trace.request_id})")
                         listening_for_command = True
                         
                         # Stop the current utterance detection
                         decoder.end_utt() 
                         
                         # Prepare for command streaming
-                        pre_speech_buffer = collections.deque(maxlen=PRE_SPEECH_BUFFER_CHUNKS)
                         triggered = False
-                        silence_chunks = 0
                         
                         try:
-                            with grpc.insecure_channel(BRAIN_ADDRESS) as channel:
-                                stub = audiostream_pb2_grpc.AudioStreamerStub(channel)
-                                print(f"Connecting to server at {BRAIN_ADDRESS}...")
+                            packer = AudioChunkPacker(brain.codec())
+                            
+                            def command_audio_iterator():
+                                nonlocal listening_for_command, triggered
+                                print("✅ Listening for command...")
                                 
-                                def command_audio_iterator():
-                                    nonlocal listening_for_command, triggered, silence_chunks
-                                    print("✅ Listening for command...")
-                                    
-                                    # First, yield the current chunk that might have triggered the wake word
-                                    yield audiostream_pb2.AudioChunk(audio_chunk=chunk_bytes)
+                                # Only the command's speech is sent: not the wake word,
+                                # not the silence before it, and not the silence after it.
+                                detector = SpeechDetector(SPEECH_START_CHUNKS, SPEECH_START_WINDOW,
+                                                          SPEECH_END_WINDOW, SPEECH_END_RATIO)
+                                while listening_for_command:
+                                    cmd_index, cmd_chunk_bytes = cursor.read()
                                     
-                                    while listening_for_command:
-                                        cmd_chunk, _ = stream.read(CHUNK_SIZE)
-                                        cmd_chunk_bytes = cmd_chunk.tobytes()
-                                        
-                                        if not triggered:
-                                            pre_speech_buffer.append(cmd_chunk_bytes)
-                                        
-                                        is_speech = vad.is_speech(cmd_chunk_bytes, SAMPLE_RATE)
-
-                                        if is_speech:
-                                            if not triggered:
-                                                print("Speech detected, streaming...")
-                                                triggered = True
-                                                for buffered_chunk in pre_speech_buffer:
-                                                    yield audiostream_pb2.AudioChunk(audio_chunk=buffered_chunk)
-                                                pre_speech_buffer.clear()
-                                            
-                                            yield audiostream_pb2.AudioChunk(audio_chunk=cmd_chunk_bytes)
-                                            silence_chunks = 0
-                                        elif triggered:
-                                            yield audiostream_pb2.AudioChunk(audio_chunk=cmd_chunk_bytes)
-                                            silence_chunks += 1
-                                            if silence_chunks > SILENCE_CHUNKS_TRIGGER:
-                                                print("End of command detected.")
-                                                listening_for_command = False
-                                        elif not triggered and len(pre_speech_buffer) == PRE_SPEECH_BUFFER_CHUNKS:
-                                            print("No command heard, timing out.")
-                                            listening_for_command = False
-                                
-                                response = stub.StreamAudio(command_audio_iterator())
+                                    is_speech = vad.is_speech(cmd_chunk_bytes, SAMPLE_RATE)
+                                    state, started, ended = detector.update(is_speech)
+
+                                    if started:
+                                        trace.mark("speech_start")
+                                        print("Speech detected, streaming...")
+                                        triggered = True
+                                        packer.start()
+                                        # Pre-roll: the frames just before speech, still in the ring.
+                                        pre_roll_start = max(cmd_index - PRE_SPEECH_BUFFER_CHUNKS + 1, wake_index + 1)
+                                        for buffered_chunk in cursor.frames(pre_roll_start, cmd_index):
+                                            yield from packer.add(buffered_chunk)
+
+                                    if state == SPEECH or ended:
+                                        yield from packer.add(cmd_chunk_bytes, is_speech)
+                                    if ended:
+                                        trace.mark("speech_end")
+                                        print("End of command detected.")
+                                        listening_for_command = False
+                                    elif not triggered and cmd_index - wake_index >= NO_SPEECH_TIMEOUT_CHUNKS:
+                                        print("No command heard, timing out.")
+                                        listening_for_command = False
+
+                                yield from packer.flush(end=triggered)
+                            
+                            if PLAY_REPLY_ON_ACU:
+                                def stop_sending():
+                                    nonlocal listening_for_command
+                                    listening_for_command = False
+                                play_server_events(brain.stub.Converse(command_audio_iterator(), metadata=metadata, wait_for_ready=True), stop_sending, trace)
+                            else:
+                                response = brain.stub.StreamAudio(command_audio_iterator(), metadata=metadata, wait_for_ready=True)
+                                trace.mark("receipt")
+                                wake_to_receipt.observe(trace.elapsed("start", "receipt"))
                                 print(f"Server response: '{response.status_message}'")
-                        
+
                         except grpc.RpcError as e:
                             print(f"gRPC stream failed: {e}")
                         finally:
                             # Reset state for the next wake word
                             listening_for_command = False
+                            print(f"Trace {trace.summary()}")
+                            # Skip what was captured while the reply played; listen from now on.
+                            cursor = ring.reader()
+                            print(f"Capture: max read latency {ring.max_latency * 1000:.0f} ms, "
+                                  f"{ring.overflow_count} overflows, {ring.dropped_count} dropped frames.")
                             print(f"\n✅ ACU is running. Waiting for '{WAKE_WORD}'...")
                             decoder.start_utt() # Start a new utterance for the next wake word
 
@@ -0,0 +1,45 @@
+# filename: acu_pi/speech_detector.py
+# Smoothed voice activity detection for the ACU. webrtcvad gives one verdict
+# per 30 ms frame and flips on clicks, breaths and short pauses; this turns
+# those verdicts into speech segments with a start and an end, so only the
+# speech itself is sent to the Brain.
+
+from collections import deque
+
+SILENCE = "silence"
+SPEECH = "speech"
+
+class SpeechDetector:
+    """
+    Two-state machine over a sliding window of VAD verdicts:
+    - silence -> speech when at least start_frames of the last start_window
+      frames are speech (a single noisy frame doesn't start a segment);
+    - speech -> silence when at least end_ratio of the last end_window frames
+      are silence (short pauses between words don't end it).
+    """
+
+    def __init__(self, start_frames=3, start_window=5, end_window=20, end_ratio=0.9):
+        self.start_frames = start_frames
+        self.end_window = end_window
+        self.end_ratio = end_ratio
+        self.recent_start = deque(maxlen=start_window)
+        self.recent_end = deque(maxlen=end_window)
+        self.state = SILENCE
+
+    def update(self, is_speech):
+        """Adds one frame's verdict. Returns (state, started, ended) for this frame."""
+        self.recent_start.append(is_speech)
+        self.recent_end.append(is_speech)
+        if self.state == SILENCE:
+            if sum(self.recent_start) >= self.start_frames:
+                self.state = SPEECH
+                self.recent_end.clear()
+                self.recent_end.extend(self.recent_start)
+                return self.state, True, False
+        elif len(self.recent_end) == self.end_window:
+            silent = self.end_window - sum(self.recent_end)
+            if silent >= self.end_ratio * self.end_window:
+                self.state = SILENCE
+                self.recent_start.clear()
+                return self.state, False, True
+        return self.state, False, False
@@ -0,0 +1,406 @@
+# Filename: bench/replay.py
+# Replays recorded commands against a running Brain through the same gRPC
+# client path an ACU uses (AudioStreamerStub.Converse), at real-time or
+# accelerated pace and with several simulated ACUs at once, then reports
+# throughput, per-stage latency percentiles and the word error rate.
+#
+# The corpus is a directory of 16-bit mono WAV files plus references.tsv,
+# one "<file name>\t<what was said>" per line (numbers spelled out, as Vosk
+# writes them). Run bench/run_brain.py first to get a Brain backed by
+# stand-in services, or point --brain at a real one.
+#
+#   python bench/replay.py corpus/ --concurrency 4 --speed 2 --json before.json
+
+import argparse
+import json
+import math
+import os
+import re
+import sys
+import threading
+import time
+import wave
+from concurrent import futures
+
+import grpc
+import numpy as np
+import requests
+
+try:
+    import webrtcvad
+except ImportError:
+    webrtcvad = None
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.join(PROJECT_ROOT, 'protos'))
+sys.path.append(os.path.join(PROJECT_ROOT, 'common'))
+sys.path.append(os.path.join(PROJECT_ROOT, 'acu_pi'))
+
+import audiostream_pb2
+import audiostream_pb2_grpc
+from audio_codec import OpusFrameEncoder, opus_available
+from speech_detector import SPEECH, SpeechDetector
+from tracing import Trace
+
+SAMPLE_RATE = 16000
+FRAME_MS = 30
+FRAMES_PER_MESSAGE = 3  # Same packing as the ACU
+# The ACU's VAD settings (acu_pi/listener_client.py), so the Brain gets the
+# same speech-only stream, with the same start and end flags, as in the field.
+VAD_AGGRESSIVENESS = 1
+PRE_SPEECH_BUFFER_CHUNKS = 10
+SPEECH_START_CHUNKS = 3
+SPEECH_START_WINDOW = 5
+SPEECH_END_WINDOW = 20
+SPEECH_END_RATIO = 0.9
+TRAILING_SILENCE_SECONDS = 1.0  # Appended so the end of speech is detected as it would be live
+# Client-side stages, in the order they happen. "sent" is when the last
+# audio chunk went out, i.e. when the speaker stopped talking.
+STAGES = ("first_partial", "endpoint", "transcript", "first_audio", "done", "total")
+STAGE_DESCRIPTIONS = {
+    "first_partial": "stream start -> first partial transcript",
+    "endpoint": "last chunk sent -> endpoint detected",
+    "transcript": "last chunk sent -> final transcript",
+    "first_audio": "last chunk sent -> first reply audio",
+    "done": "last chunk sent -> reply complete",
+    "total": "stream start -> reply complete",
+}
+
+# --- Corpus ---
+def load_wav(path):
+    """Reads a WAV file as 16 kHz mono 16-bit PCM bytes, resampling if needed."""
+    with wave.open(path, 'rb') as wav_file:
+        rate = wav_file.getframerate()
+        channels = wav_file.getnchannels()
+        if wav_file.getsampwidth() != 2:
+            raise ValueError(f"{path} must be 16-bit PCM")
+        samples = np.frombuffer(wav_file.readframes(wav_file.getnframes()), dtype='<i2')
+    if channels > 1:
+        samples = samples.reshape(-1, channels).mean(axis=1)
+    if rate != SAMPLE_RATE:
+        positions = np.arange(0, len(samples), rate / SAMPLE_RATE)
+        samples = np.interp(positions, np.arange(len(samples)), samples)
+    return np.asarray(samples).astype('<i2').tobytes()
+
+def load_corpus(directory):
+    """Returns [(name, pcm, reference)] for every line of references.tsv."""
+    corpus = []
+    with open(os.path.join(directory, 'references.tsv'), encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            name, _, reference = line.partition('\t')
+            corpus.append((name, load_wav(os.path.join(directory, name)), reference.strip()))
+    return corpus
+
+# --- Word error rate ---
+def words(text):
+    return re.sub(r"[^a-z0-9' ]+", " ", text.lower()).split()
+
+def edit_distance(reference, hypothesis):
+    """Word-level Levenshtein distance (substitutions + deletions + insertions)."""
+    previous = list(range(len(hypothesis) + 1))
+    for i, ref_word in enumerate(reference, 1):
+        current = [i]
+        for j, hyp_word in enumerate(hypothesis, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1,
+                               previous[j - 1] + (ref_word != hyp_word)))
+        previous = current
+    return previous[-1]
+
+# --- Replay ---
+def audio_messages(pcm, codec):
+    """
+    Turns a recorded command into the AudioChunk messages an ACU would send,
+    as (seconds into the recording when the message is ready, message).
+    The ACU's SpeechDetector decides what is sent: nothing before speech
+    starts except the pre-roll, then speech and short pauses tagged
+    VAD_SPEECH/VAD_SILENCE, and speech_end on the last message. Without
+    webrtcvad the whole file is sent as VAD_UNKNOWN with speech_end left
+    unset, like an ACU without VAD, so the Brain's own endpointing ends it.
+    """
+    frame_bytes = SAMPLE_RATE * FRAME_MS // 1000 * 2
+    pcm = pcm + bytes(int(TRAILING_SILENCE_SECONDS * SAMPLE_RATE) * 2)
+    frames = [pcm[offset:offset + frame_bytes] for offset in range(0, len(pcm) - frame_bytes + 1, frame_bytes)]
+    encoder = OpusFrameEncoder(SAMPLE_RATE) if codec == audiostream_pb2.OPUS else None
+    messages = []
+    batch = []  # (frame, is_speech) waiting to be packed
+
+    def pack(index, start=False, end=False):
+        audio = b"".join(frame for frame, _ in batch)
+        flags = [is_speech for _, is_speech in batch]
+        if None in flags:
+            vad = audiostream_pb2.VAD_UNKNOWN
+        else:
+            vad = audiostream_pb2.VAD_SPEECH if any(flags) else audiostream_pb2.VAD_SILENCE
+        message = audiostream_pb2.AudioChunk(codec=codec, speech_start=start, speech_end=end, vad=vad)
+        if encoder:
+            message.opus_packets.extend(encoder.encode(audio))
+            if end:
+                message.opus_packets.extend(encoder.flush())
+        else:
+            message.audio_chunk = audio
+        messages.append(((index + 1) * FRAME_MS / 1000, message))
+        batch.clear()
+
+    if webrtcvad is None:
+        for index, frame in enumerate(frames):
+            batch.append((frame, None))
+            if len(batch) == FRAMES_PER_MESSAGE:
+                pack(index, start=not messages)
+        if batch:
+            pack(len(frames) - 1, start=not messages)
+        return messages
+
+    vad = webrtcvad.Vad(VAD_AGGRESSIVENESS)
+    detector = SpeechDetector(SPEECH_START_CHUNKS, SPEECH_START_WINDOW, SPEECH_END_WINDOW, SPEECH_END_RATIO)
+    start_pending = False
+    for index, frame in enumerate(frames):
+        is_speech = vad.is_speech(frame, SAMPLE_RATE)
+        state, started, ended = detector.update(is_speech)
+        if started:
+            start_pending = True
+            batch.extend((pre_roll, True) for pre_roll in frames[max(0, index - PRE_SPEECH_BUFFER_CHUNKS + 1):index])
+        if state == SPEECH or ended:
+            batch.append((frame, is_speech))
+        if ended:
+            pack(index, start=start_pending, end=True)
+            return messages
+        if len(batch) >= FRAMES_PER_MESSAGE:
+            pack(index, start=start_pending)
+            start_pending = False
+    if batch:
+        pack(len(frames) - 1, start=start_pending)  # Still talking at the end of the file
+    return messages
+
+def replay_one(stub, name, pcm, reference, acu_id, codec, speed):
+    """Streams one command and times the Brain's events. Returns a result dict."""
+    trace = Trace()
+    metadata = (('x-acu-id', acu_id),) + trace.metadata()
+    stop = threading.Event()
+    times = {}
+    start_time = time.monotonic()
+
+    def requests_iterator():
+        for ready_at, message in audio_messages(pcm, codec):
+            if stop.is_set():
+                break
+            if speed > 0:
+                # Paced against the clock, so a slow send doesn't make the stream drift.
+                time.sleep(max(0.0, start_time + ready_at / speed - time.monotonic()))
+            yield message
+        times.setdefault("sent", time.monotonic())
+
+    State = audiostream_pb2.StatusEvent
+    transcript = ""
+    error = None
+    speaking = False
+    try:
+        for event in stub.Converse(requests_iterator(), metadata=metadata, wait_for_ready=True):
+            now = time.monotonic()
+            kind = event.WhichOneof('event')
+            if kind == 'transcript':
+                if event.transcript.is_final:
+                    transcript = event.transcript.text
+                    times.setdefault("transcript", now)
+                else:
+                    times.setdefault("first_partial", now)
+            elif kind == 'status':
+                state = event.status.state
+                if state == State.ENDPOINT_DETECTED:
+                    stop.set()
+                    times.setdefault("endpoint", now)
+                elif state == State.SPEAKING:
+                    speaking = True
+                elif state == State.ERROR:
+                    error = event.status.message
+                elif state == State.DONE:
+                    times.setdefault("done", now)
+            elif kind == 'audio' and speaking:
+                times.setdefault("first_audio", now)  # Audio before SPEAKING is the ack sound
+    except grpc.RpcError as e:
+        error = f"{e.code().name}: {e.details()}"
+    stop.set()
+
+    sent = times.get("sent", start_time)
+    stages = {}
+    for stage in STAGES:
+        if stage == "total":
+            if "done" in times:
+                stages[stage] = times["done"] - start_time
+        elif stage == "first_partial":
+            if stage in times:
+                stages[stage] = times[stage] - start_time
+        elif stage in times:
+            # The Brain may endpoint before the last chunk is sent; that counts as zero.
+            stages[stage] = max(0.0, times[stage] - sent)
+    errors = edit_distance(words(reference), words(transcript)) if reference else 0
+    return {"name": name, "request_id": trace.request_id, "acu_id": acu_id, "reference": reference,
+            "transcript": transcript, "word_errors": errors, "reference_words": len(words(reference)),
+            "stages": stages, "error": error}
+
+def run(stub, corpus, concurrency, repeat, codec, speed):
+    """Replays the corpus repeat times with concurrency ACUs. Returns (results, wall seconds)."""
+    jobs = [item for _ in range(repeat) for item in corpus]
+    slots = threading.local()
+    counter = iter(range(concurrency))
+    counter_lock = threading.Lock()
+
+    def acu_id():
+        # One simulated ACU per worker thread, so per-ACU admission limits apply as in the field.
+        if not hasattr(slots, "acu_id"):
+            with counter_lock:
+                slots.acu_id = f"bench-{next(counter)}"
+        return slots.acu_id
+
+    start_time = time.monotonic()
+    with futures.ThreadPoolExecutor(max_workers=concurrency) as pool:
+        pending = [pool.submit(lambda item=item: replay_one(stub, *item, acu_id(), codec, speed)) for item in jobs]
+        results = []
+        for future in pending:
+            result = future.result()
+            results.append(result)
+            status = f"error: {result['error']}" if result['error'] else f"'{result['transcript']}'"
+            print(f"[{result['request_id']}] {result['name']}: {status}")
+    return results, time.monotonic() - start_time
+
+# --- Reporting ---
+def percentile(samples, q):
+    """Nearest-rank percentile of a sorted list."""
+    return samples[max(0, min(len(samples) - 1, math.ceil(q * len(samples)) - 1))]
+
+def stage_summary(results):
+    summary = {}
+    for stage in STAGES:
+        samples = sorted(r["stages"][stage] for r in results if stage in r["stages"])
+        if samples:
+            summary[stage] = {"count": len(samples), "p50": percentile(samples, 0.50),
+                              "p95": percentile(samples, 0.95), "p99": percentile(samples, 0.99),
+                              "max": samples[-1]}
+    return summary
+
+def scrape_histograms(url):
+    """
+    Returns {(metric, labels): {"sum", "count", "buckets": {upper bound: cumulative count}}}
+    for every histogram on a /metrics page.
+    """
+    totals = {}
+    for line in requests.get(url, timeout=5).text.splitlines():
+        match = re.match(r'^(\w+)_(bucket|sum|count)(?:\{([^}]*)\})? ([0-9.eE+-]+|\+Inf|NaN)$', line)
+        if not match:
+            continue
+        name, field, labels, value = match.groups()
+        labels = dict(re.findall(r'(\w+)="([^"]*)"', labels or ""))
+        le = labels.pop("le", None)
+        key = (name, ",".join(f'{k}="{v}"' for k, v in sorted(labels.items())))
+        entry = totals.setdefault(key, {"sum": 0.0, "count": 0.0, "buckets": {}})
+        if field == "bucket":
+            entry["buckets"][float(le)] = float(value)
+        else:
+            entry[field] = float(value)
+    return totals
+
+def bucket_quantile(buckets, q):
+    """
+    Estimates a quantile from sorted (upper bound, cumulative count) pairs,
+    interpolating linearly inside the bucket it falls in, as Prometheus'
+    histogram_quantile() does. Past the last finite bound, that bound is returned.
+    """
+    rank = q * buckets[-1][1]
+    lower, below = 0.0, 0.0
+    for upper, cumulative in buckets:
+        if cumulative >= rank and cumulative > below:
+            if math.isinf(upper):
+                return lower
+            return lower + (upper - lower) * (rank - below) / (cumulative - below)
+        lower, below = upper, cumulative
+    return lower
+
+def brain_stage_summary(before, after):
+    """Count, mean and p50/p95/p99 of every Brain histogram over the run, from the scrape deltas."""
+    summary = {}
+    for key in sorted(after):
+        entry = after[key]
+        old = before.get(key, {"sum": 0.0, "count": 0.0, "buckets": {}})
+        count = entry["count"] - old["count"]
+        if count <= 0:
+            continue
+        buckets = [(bound, cumulative - old["buckets"].get(bound, 0.0))
+                   for bound, cumulative in sorted(entry["buckets"].items())]
+        name, labels = key
+        row = {"count": count, "mean": (entry["sum"] - old["sum"]) / count}
+        if buckets:
+            row.update({f"p{round(q * 100)}": bucket_quantile(buckets, q) for q in (0.50, 0.95, 0.99)})
+        summary[f"{name}{{{labels}}}" if labels else name] = row
+    return summary
+
+def report(results, elapsed, concurrency, speed, before=None, after=None):
+    failed = [r for r in results if r["error"]]
+    print(f"\nReplayed {len(results)} commands ({concurrency} concurrent, "
+          f"{'unpaced' if speed <= 0 else f'{speed:g}x real time'}) in {elapsed:.1f}s: "
+          f"{len(results) / elapsed:.2f} commands/s, {len(failed)} errors")
+
+    summary = stage_summary(results)
+    print(f"\n{'stage':14} {'n':>5} {'p50':>8} {'p95':>8} {'p99':>8} {'max':>8}")
+    for stage, row in summary.items():
+        print(f"{stage:14} {row['count']:>5} " + " ".join(f"{row[k] * 1000:>6.0f}ms" for k in ("p50", "p95", "p99", "max"))
+              + f"  {STAGE_DESCRIPTIONS[stage]}")
+
+    errors = sum(r["word_errors"] for r in results)
+    total_words = sum(r["reference_words"] for r in results)
+    wer = errors / total_words if total_words else 0.0
+    print(f"\nWER: {wer * 100:.1f}% ({errors} errors / {total_words} reference words)")
+
+    brain = None
+    if before is not None and after is not None:
+        # This run only, from the Brain's own histograms. Quantiles are
+        # interpolated within buckets, so they are estimates.
+        brain = brain_stage_summary(before, after)
+        print(f"\nBrain-side stages during the run:\n{'n':>6} {'mean':>8} {'p50':>8} {'p95':>8} {'p99':>8}  histogram")
+        for name, row in brain.items():
+            print(f"{row['count']:>6.0f} " + " ".join(f"{row[k] * 1000:>6.0f}ms" if k in row else f"{'-':>8}"
+                                                     for k in ("mean", "p50", "p95", "p99")) + f"  {name}")
+    return {"commands": len(results), "errors": len(failed), "seconds": elapsed,
+            "throughput": len(results) / elapsed, "stages": summary, "brain_stages": brain, "wer": wer}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay recorded commands against the Brain.")
+    parser.add_argument("corpus", help="Directory with WAV files and references.tsv.")
+    parser.add_argument("--brain", default="localhost:50051", help="Brain gRPC address.")
+    parser.add_argument("--concurrency", type=int, default=1, help="Simulated ACUs streaming at once.")
+    parser.add_argument("--repeat", type=int, default=1, help="Times to replay the whole corpus.")
+    parser.add_argument("--speed", type=float, default=1.0, help="Playback speed (1 = real time, 0 = as fast as possible).")
+    parser.add_argument("--codec", choices=("pcm", "opus"), default="pcm")
+    parser.add_argument("--metrics-url", default="http://localhost:9102/metrics",
+                        help="Brain metrics page for the server-side breakdown ('' to skip).")
+    parser.add_argument("--json", help="Also write the summary and every result to this file.")
+    args = parser.parse_args()
+
+    if args.codec == "opus" and not opus_available():
+        parser.error("--codec opus needs opuslib")
+    codec = audiostream_pb2.OPUS if args.codec == "opus" else audiostream_pb2.PCM_S16LE
+    corpus = load_corpus(args.corpus)
+    print(f"Loaded {len(corpus)} commands from {args.corpus}.")
+    if webrtcvad is None:
+        print("webrtcvad is not installed: sending whole files without VAD, the Brain endpoints them.")
+
+    channel = grpc.insecure_channel(args.brain)
+    grpc.channel_ready_future(channel).result(timeout=30)
+    stub = audiostream_pb2_grpc.AudioStreamerStub(channel)
+
+    before = after = None
+    if args.metrics_url:
+        try:
+            before = scrape_histograms(args.metrics_url)
+        except requests.exceptions.RequestException as e:
+            print(f"Could not read {args.metrics_url}, skipping the Brain-side breakdown: {e}")
+    results, elapsed = run(stub, corpus, args.concurrency, args.repeat, codec, args.speed)
+    if before is not None:
+        after = scrape_histograms(args.metrics_url)
+    summary = report(results, elapsed, args.concurrency, args.speed, before, after)
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({"summary": summary, "results": results}, f, indent=2)
+        print(f"Results written to {args.json}.")
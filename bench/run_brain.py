@@ -0,0 +1,86 @@
+# Filename: bench/run_brain.py
+# Runs the real Brain (brain_jetson/handler_server.py) for a benchmark, with
+# the stand-ins from standins.py in place of Ollama, OpenAI and the TTS
+# server, and an in-memory inventory in place of MySQL. Everything else
+# (ASR, intent routing, caches, the pipeline, admission control) is the code
+# that runs on the Jetson.
+#
+#   python bench/run_brain.py --vosk-model ~/va-assistant/vosk-model-small-en-us-0.15
+#
+# then replay a corpus against it with bench/replay.py.
+
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.dirname(BENCH_DIR)
+sys.path.append(os.path.join(PROJECT_ROOT, 'brain_jetson'))
+
+from standins import add_arguments, config_from_args, start_standins
+
+SAMPLE_INVENTORY = {"resistor": 120, "capacitor": 45, "raspberry pi": 3, "soldering iron": 1, "multimeter": 2}
+
+class MemoryInventoryDB:
+    """In-process stand-in for InventoryDB, with a fixed delay per query to mimic the MySQL round trip."""
+
+    def __init__(self, items=None, latency=0.002):
+        self.items = dict(items or SAMPLE_INVENTORY)
+        self.latency = latency
+        self.timings = {}
+        self.lock = threading.Lock()
+
+    def _query(self, name, run):
+        start_time = time.monotonic()
+        time.sleep(self.latency)
+        with self.lock:
+            result = run()
+        seconds = time.monotonic() - start_time
+        with self.lock:
+            count, total, worst = self.timings.get(name, (0, 0.0, 0.0))
+            self.timings[name] = (count + 1, total + seconds, max(worst, seconds))
+        return result
+
+    def timing_summary(self):
+        with self.lock:
+            return {name: (count, total / count, worst) for name, (count, total, worst) in self.timings.items()}
+
+    def fetch_all(self):
+        return self._query("select_all", lambda: list(self.items.items()))
+
+    def find(self, item_name):
+        return self._query("select_like", lambda: [(item, quantity) for item, quantity in self.items.items()
+                                                   if item_name.lower() in item.lower()])
+
+    def add(self, item_name, quantity):
+        def upsert():
+            self.items[item_name] = self.items.get(item_name, 0) + quantity
+            return 1
+        return self._query("upsert", upsert)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the Brain against local stand-in services.")
+    parser.add_argument("--vosk-model", help="Vosk model directory (default: the Brain's configured path).")
+    parser.add_argument("--db-latency", type=float, default=0.002, help="Simulated MySQL query time (s).")
+    parser.add_argument("--keep-response-cache", action="store_true",
+                        help="Use the Brain's real response cache instead of an empty one per run.")
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    # handler_server reads its configuration at import time, so the
+    # environment has to point at the stand-ins before it is imported.
+    os.environ.update(start_standins(config_from_args(args)))
+    os.environ.setdefault("OPENAI_API_KEY", "bench")
+    for name in ("MYSQL_HOST", "MYSQL_USER", "MYSQL_PASSWORD", "MYSQL_DB"):
+        os.environ.setdefault(name, "bench")
+    if not args.keep_response_cache:
+        os.environ["BRAIN_RESPONSE_CACHE"] = os.path.join(tempfile.mkdtemp(prefix="brain-bench-"), "responses")
+
+    import handler_server
+    handler_server.InventoryDB = lambda *_, **__: MemoryInventoryDB(latency=args.db_latency)
+    if args.vosk_model:
+        handler_server.VOSK_MODEL_PATH = os.path.expanduser(args.vosk_model)
+    handler_server.serve()
@@ -0,0 +1,251 @@
+# Filename: bench/standins.py
+# Local stand-ins for the services the Brain calls, for offline benchmarks:
+# an Ollama API (chat, embeddings, ps), an OpenAI chat-completions API and the
+# TTS server's streaming endpoint. Each answers with canned content after a
+# configurable delay, so a replay run measures the Brain itself with known,
+# repeatable backend latencies.
+#
+#   python bench/standins.py --llm-ttft 0.4 --cloud-ttft 0.9 --tts-first-audio 0.3
+#
+# prints the environment variables that point the Brain at them.
+
+import argparse
+import hashlib
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+EMBEDDING_SIZE = 384  # Same as all-minilm
+TTS_SAMPLE_RATE = 24000
+TTS_CHUNK_SECONDS = 0.1
+SPEECH_SECONDS_PER_WORD = 0.35
+LOCAL_ANSWER = "This is a stand-in answer from the local model. It has two sentences so the reply is streamed."
+CLOUD_ANSWER = "This is a stand-in answer from the cloud model. It has two sentences so the reply is streamed."
+
+class StandInConfig:
+    """Latencies of the stand-ins, in seconds (rates in tokens per second)."""
+
+    def __init__(self, llm_ttft=0.3, llm_rate=20.0, cloud_ttft=0.8, cloud_rate=60.0,
+                 embed_latency=0.02, tts_first_audio=0.3, tts_rtf=0.3):
+        self.llm_ttft = llm_ttft
+        self.llm_rate = llm_rate
+        self.cloud_ttft = cloud_ttft
+        self.cloud_rate = cloud_rate
+        self.embed_latency = embed_latency
+        self.tts_first_audio = tts_first_audio
+        self.tts_rtf = tts_rtf  # Render time per second of audio after the first chunk
+
+def tokens(text):
+    """Splits an answer into word-sized pieces, as an LLM would stream it."""
+    words = text.split(" ")
+    return [word + " " for word in words[:-1]] + words[-1:]
+
+def fake_embedding(text):
+    """A deterministic unit vector per text: equal questions match, different ones don't."""
+    seed = int.from_bytes(hashlib.sha1(text.strip().lower().encode('utf-8')).digest()[:4], 'little')
+    vector = np.random.default_rng(seed).standard_normal(EMBEDDING_SIZE)
+    return (vector / np.linalg.norm(vector)).tolist()
+
+class StandInHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.0'  # Streamed bodies end when the connection closes
+
+    @property
+    def config(self):
+        return self.server.config
+
+    def read_json(self):
+        length = int(self.headers.get('Content-Length', 0))
+        return json.loads(self.rfile.read(length) or b'{}')
+
+    def send_json(self, payload, status=200):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def start_stream(self, content_type, headers=None):
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+class OllamaHandler(StandInHandler):
+    """The parts of the Ollama API the Brain uses."""
+
+    def do_GET(self):
+        if self.path == '/api/ps':
+            models = [{"name": name, "model": name} for name in sorted(self.server.loaded)]
+            self.send_json({"models": models})
+        elif self.path == '/api/version':
+            self.send_json({"version": "0.0.0-standin"})
+        else:
+            self.send_error(404)
+
+    def do_POST(self):
+        request = self.read_json()
+        if self.path == '/api/chat':
+            self.chat(request)
+        elif self.path == '/api/embeddings':
+            time.sleep(self.config.embed_latency)
+            self.send_json({"embedding": fake_embedding(request.get('prompt', ''))})
+        elif self.path == '/api/embed':
+            time.sleep(self.config.embed_latency)
+            inputs = request.get('input', '')
+            inputs = [inputs] if isinstance(inputs, str) else inputs
+            self.send_json({"model": request.get('model'), "embeddings": [fake_embedding(text) for text in inputs]})
+        else:
+            self.send_error(404)
+
+    def chat(self, request):
+        model = request.get('model', '')
+        self.server.loaded.add(model)
+        pieces = tokens(LOCAL_ANSWER)
+        options = request.get('options') or {}
+        if 'num_predict' in options:
+            pieces = pieces[:options['num_predict']]
+        start_time = time.monotonic()
+        time.sleep(self.config.llm_ttft)
+
+        def message(content, done=False):
+            chunk = {"model": model, "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+                     "message": {"role": "assistant", "content": content}, "done": done}
+            if done:
+                elapsed_ns = int((time.monotonic() - start_time) * 1e9)
+                chunk.update(done_reason="stop", total_duration=elapsed_ns, load_duration=0,
+                             prompt_eval_count=len(json.dumps(request.get('messages', []))) // 4,
+                             prompt_eval_duration=int(self.config.llm_ttft * 1e9),
+                             eval_count=len(pieces),
+                             eval_duration=max(0, elapsed_ns - int(self.config.llm_ttft * 1e9)))
+            return chunk
+
+        if not request.get('stream', True):
+            time.sleep(len(pieces) / self.config.llm_rate)
+            self.send_json(message("".join(pieces), done=True))
+            return
+        self.start_stream('application/x-ndjson')
+        for piece in pieces:
+            self.wfile.write((json.dumps(message(piece)) + "\n").encode('utf-8'))
+            self.wfile.flush()
+            time.sleep(1.0 / self.config.llm_rate)
+        self.wfile.write((json.dumps(message("", done=True)) + "\n").encode('utf-8'))
+
+class OpenAIHandler(StandInHandler):
+    """Streaming /v1/chat/completions, as the OpenAI client calls it."""
+
+    def do_POST(self):
+        if self.path.rstrip('/') != '/v1/chat/completions':
+            self.send_error(404)
+            return
+        request = self.read_json()
+        model = request.get('model', '')
+        time.sleep(self.config.cloud_ttft)
+        created = int(time.time())
+
+        def chunk(delta, finish_reason=None):
+            return {"id": "chatcmpl-standin", "object": "chat.completion.chunk", "created": created,
+                    "model": model, "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}]}
+
+        if not request.get('stream'):
+            self.send_json({"id": "chatcmpl-standin", "object": "chat.completion", "created": created,
+                            "model": model, "choices": [{"index": 0, "finish_reason": "stop",
+                                                         "message": {"role": "assistant", "content": CLOUD_ANSWER}}]})
+            return
+        self.start_stream('text/event-stream')
+        events = [chunk({"role": "assistant", "content": ""})]
+        events += [chunk({"content": piece}) for piece in tokens(CLOUD_ANSWER)]
+        events.append(chunk({}, finish_reason="stop"))
+        for event in events:
+            self.wfile.write(f"data: {json.dumps(event)}\n\n".encode('utf-8'))
+            self.wfile.flush()
+            time.sleep(1.0 / self.config.cloud_rate)
+        self.wfile.write(b"data: [DONE]\n\n")
+
+class TTSHandler(StandInHandler):
+    """/api/tts/stream: a quiet tone roughly as long as the text would take to say."""
+
+    def do_GET(self):
+        if self.path == '/api/voices':
+            self.send_json({"default": "standin", "voices": ["standin"]})
+        else:
+            self.send_error(404)
+
+    def do_POST(self):
+        if self.path != '/api/tts/stream':
+            self.send_error(404)
+            return
+        text = self.read_json().get('text', '')
+        if not text.strip():
+            self.send_json({"error": "No text provided"}, status=400)
+            return
+        seconds = max(0.5, len(text.split()) * SPEECH_SECONDS_PER_WORD)
+        time.sleep(self.config.tts_first_audio)
+        self.start_stream('application/octet-stream', {
+            "X-Request-ID": self.headers.get('X-Request-ID', ''),
+            "X-Sample-Rate": str(TTS_SAMPLE_RATE),
+            "X-Channels": "1",
+            "X-Sample-Format": "s16le",
+        })
+        chunk_samples = int(TTS_SAMPLE_RATE * TTS_CHUNK_SECONDS)
+        tone = (np.sin(2 * np.pi * 220 * np.arange(chunk_samples) / TTS_SAMPLE_RATE) * 1000).astype('<i2').tobytes()
+        for _ in range(int(seconds / TTS_CHUNK_SECONDS)):
+            self.wfile.write(tone)
+            self.wfile.flush()
+            time.sleep(TTS_CHUNK_SECONDS * self.config.tts_rtf)
+
+def _serve(handler, host, port, config):
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    server.config = config
+    server.loaded = set()
+    threading.Thread(target=server.serve_forever, name=f"standin-{port}", daemon=True).start()
+    return server
+
+def start_standins(config=None, host='127.0.0.1', ollama_port=11435, openai_port=8081, tts_port=5003):
+    """Starts all three stand-ins. Returns the environment variables that point the Brain at them."""
+    config = config or StandInConfig()
+    _serve(OllamaHandler, host, ollama_port, config)
+    _serve(OpenAIHandler, host, openai_port, config)
+    _serve(TTSHandler, host, tts_port, config)
+    return {
+        "OLLAMA_HOST": f"http://{host}:{ollama_port}",
+        "OPENAI_BASE_URL": f"http://{host}:{openai_port}/v1",
+        "TTS_SERVER_URL": f"http://{host}:{tts_port}",
+    }
+
+def add_arguments(parser):
+    defaults = StandInConfig()
+    parser.add_argument("--llm-ttft", type=float, default=defaults.llm_ttft, help="Local model time to first token (s).")
+    parser.add_argument("--llm-rate", type=float, default=defaults.llm_rate, help="Local model tokens per second.")
+    parser.add_argument("--cloud-ttft", type=float, default=defaults.cloud_ttft, help="Cloud model time to first token (s).")
+    parser.add_argument("--cloud-rate", type=float, default=defaults.cloud_rate, help="Cloud model tokens per second.")
+    parser.add_argument("--embed-latency", type=float, default=defaults.embed_latency, help="Embedding request latency (s).")
+    parser.add_argument("--tts-first-audio", type=float, default=defaults.tts_first_audio, help="TTS time to first audio (s).")
+    parser.add_argument("--tts-rtf", type=float, default=defaults.tts_rtf, help="TTS render time per second of audio.")
+
+def config_from_args(args):
+    return StandInConfig(args.llm_ttft, args.llm_rate, args.cloud_ttft, args.cloud_rate,
+                         args.embed_latency, args.tts_first_audio, args.tts_rtf)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Stand-in Ollama, OpenAI and TTS servers for benchmarks.")
+    parser.add_argument("--host", default="127.0.0.1")
+    add_arguments(parser)
+    args = parser.parse_args()
+    env = start_standins(config_from_args(args), args.host)
+    print("Stand-ins running. Point the Brain at them with:")
+    for name, value in env.items():
+        print(f"  export {name}={value}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        print("\nStopping stand-ins.")
@@ -0,0 +1,86 @@
+# Filename: brain_jetson/admission.py
+# Admission control for several ACUs sharing one Brain. Streams are capped in
+# total and per ACU, and skills that tie up an LLM or the cloud are capped by
+# cost class, so a burst of long questions can't starve the quick local
+# skills. Anything over a cap gets an immediate "busy" answer instead of
+# joining a queue where it would time out along with everything else.
+
+import threading
+from contextlib import contextmanager
+
+from intents import CLOUD, LLM, LOCAL
+from metrics import REGISTRY
+
+# Lower runs first in the stage queues: local skills answer in milliseconds,
+# cloud questions take seconds.
+PRIORITIES = {LOCAL: 0, LLM: 1, CLOUD: 2}
+DEFAULT_PRIORITY = 1  # Before the intent stage has routed the job
+
+rejections = REGISTRY.counter("brain_admission_rejections_total", "Requests turned away by admission control, by reason.")
+in_flight = REGISTRY.gauge("brain_admission_in_flight", "Admitted jobs still running, by cost class.")
+open_streams = REGISTRY.gauge("brain_admission_streams", "ACU streams currently admitted.")
+
+class AdmissionController:
+    """
+    max_streams bounds concurrent ACU streams (keep it below the gRPC worker
+    count so a worker is always free to say "busy"), max_streams_per_acu
+    bounds one ACU, and class_limits maps a cost class to the number of jobs
+    of that class allowed in flight. Classes without a limit are always admitted.
+    """
+
+    def __init__(self, max_streams, max_streams_per_acu, class_limits):
+        self.max_streams = max_streams
+        self.max_streams_per_acu = max_streams_per_acu
+        self.class_limits = class_limits
+        self.streams = {}
+        self.jobs = {cost: 0 for cost in PRIORITIES}
+        self.lock = threading.Lock()
+        open_streams.set_function(lambda: sum(self.streams.values()))
+        for cost in PRIORITIES:
+            in_flight.set_function(lambda cost=cost: self.jobs[cost], cost=cost)
+
+    # --- Streams ---
+    def open_stream(self, acu_id):
+        with self.lock:
+            if sum(self.streams.values()) >= self.max_streams:
+                reason = "brain_streams"
+            elif self.streams.get(acu_id, 0) >= self.max_streams_per_acu:
+                reason = "acu_streams"
+            else:
+                self.streams[acu_id] = self.streams.get(acu_id, 0) + 1
+                return True
+        print(f"Turning away a stream from ACU '{acu_id}' ({reason} limit reached).")
+        rejections.inc(reason=reason)
+        return False
+
+    def close_stream(self, acu_id):
+        with self.lock:
+            remaining = self.streams.get(acu_id, 0) - 1
+            if remaining > 0:
+                self.streams[acu_id] = remaining
+            else:
+                self.streams.pop(acu_id, None)
+
+    @contextmanager
+    def stream(self, acu_id):
+        """Yields True if the stream was admitted; releases it on exit."""
+        admitted = self.open_stream(acu_id)
+        try:
+            yield admitted
+        finally:
+            if admitted:
+                self.close_stream(acu_id)
+
+    # --- Jobs ---
+    def admit_job(self, cost):
+        limit = self.class_limits.get(cost)
+        with self.lock:
+            if limit is not None and self.jobs[cost] >= limit:
+                rejections.inc(reason=f"{cost}_jobs")
+                return False
+            self.jobs[cost] += 1
+            return True
+
+    def release_job(self, cost):
+        with self.lock:
+            self.jobs[cost] -= 1
@@ -0,0 +1,234 @@
+# Filename: brain_jetson/asr.py
+# Incremental speech recognition for the Brain: feeds audio into Vosk as it
+# arrives and decides on the server side when the speaker has finished.
+
+import json
+import queue
+import threading
+
+import numpy as np
+from vosk import KaldiRecognizer
+
+# The small English model endpoints after 0.5 s of trailing silence
+# (see conf/model.conf), which is much sooner than the ACU's 1.5 s timeout.
+# A partial that hasn't changed for this long also ends the utterance, in
+# case Vosk never emits a final segment (e.g. steady background noise).
+# Both limits are measured in audio, since ACUs may pack several frames
+# into one message.
+STABLE_PARTIAL_SECONDS = 0.75
+MAX_UTTERANCE_SECONDS = 15.0
+# The grammar result replaces the open-vocabulary one only when Vosk is at
+# least this confident in every word it matched.
+GRAMMAR_MIN_CONFIDENCE = 0.75
+
+def synthetic_utterance(sample_rate, seconds=1.5):
+    """
+    A speech-like test signal (a few harmonics of a gliding pitch, amplitude
+    modulated at syllable rate, with a little noise) bracketed by silence.
+    Decoding it exercises the acoustic model and decoding graph the same
+    way a real command does.
+    """
+    rng = np.random.default_rng(0)
+    t = np.arange(int(sample_rate * seconds)) / sample_rate
+    pitch = 120 + 40 * np.sin(2 * np.pi * 0.7 * t)
+    phase = 2 * np.pi * np.cumsum(pitch) / sample_rate
+    voiced = sum(np.sin(k * phase) / k for k in range(1, 6))
+    envelope = 0.5 * (1 - np.cos(2 * np.pi * 4 * t))
+    signal = 0.3 * voiced * envelope + 0.02 * rng.standard_normal(t.size)
+    silence = np.zeros(int(sample_rate * 0.3))
+    samples = np.concatenate([silence, signal / np.max(np.abs(signal)) * 0.5, silence])
+    return (samples * 32767).astype('<i2').tobytes()
+
+class RecognizerPool:
+    """
+    Pre-built recognizers, one per gRPC worker, so no stream pays for
+    KaldiRecognizer construction. Recognizers are reset when returned.
+    """
+
+    def __init__(self, model, sample_rate, size):
+        self.model = model
+        self.sample_rate = sample_rate
+        self.size = size
+        self.idle = queue.Queue()
+        for _ in range(size):
+            self.idle.put(self._build())
+
+    def _build(self):
+        return KaldiRecognizer(self.model, self.sample_rate)
+
+    def acquire(self):
+        try:
+            return self.idle.get_nowait()
+        except queue.Empty:
+            # More concurrent streams than workers; build one rather than wait.
+            print("Recognizer pool exhausted, building an extra recognizer.")
+            return self._build()
+
+    def release(self, rec):
+        rec.Reset()
+        if self.idle.qsize() < self.size:
+            self.idle.put(rec)
+
+    def warm_up(self):
+        """Runs a synthetic utterance through every pooled recognizer."""
+        audio = synthetic_utterance(self.sample_rate)
+        chunk_bytes = int(self.sample_rate * 0.03) * 2
+        recs = [self.acquire() for _ in range(self.size)]
+        for rec in recs:
+            for i in range(0, len(audio), chunk_bytes):
+                rec.AcceptWaveform(audio[i:i + chunk_bytes])
+            rec.FinalResult()
+        for rec in recs:
+            self.release(rec)
+
+class GrammarRecognizerPool(RecognizerPool):
+    """
+    Recognizers restricted to a phrase list (skill commands, numbers, item
+    names). Calling set_phrases() swaps in a new grammar; recognizers built
+    for an older grammar are dropped when they come back to the pool.
+    """
+
+    def __init__(self, model, sample_rate, size, phrases):
+        self.lock = threading.Lock()
+        self.rebuild_lock = threading.Lock()  # One set_phrases() at a time, so the pool is refilled once
+        self.grammar = self._grammar_json(phrases)
+        self.generation = 0
+        self.generations = {}
+        super().__init__(model, sample_rate, size)
+
+    @staticmethod
+    def _grammar_json(phrases):
+        words = sorted({" ".join(p.lower().split()) for p in phrases if p.strip()})
+        return json.dumps(words + ["[unk]"])
+
+    def _build(self):
+        with self.lock:
+            grammar, generation = self.grammar, self.generation
+        rec = KaldiRecognizer(self.model, self.sample_rate, grammar)
+        rec.SetWords(True)
+        with self.lock:
+            self.generations[id(rec)] = generation
+        return rec
+
+    def set_phrases(self, phrases):
+        grammar = self._grammar_json(phrases)
+        with self.rebuild_lock:
+            with self.lock:
+                if grammar == self.grammar:
+                    return
+                self.grammar = grammar
+                self.generation += 1
+            # Built outside the pool lock so streams can still return recognizers meanwhile.
+            fresh = [self._build() for _ in range(self.size)]
+            with self.lock:
+                while True:
+                    try:
+                        stale = self.idle.get_nowait()
+                    except queue.Empty:
+                        break
+                    self.generations.pop(id(stale), None)
+                for rec in fresh:
+                    self.idle.put(rec)
+        print(f"Command grammar rebuilt with {len(json.loads(grammar)) - 1} phrases.")
+
+    def release(self, rec):
+        rec.Reset()
+        with self.lock:
+            if self.generations.get(id(rec)) == self.generation and self.idle.qsize() < self.size:
+                self.idle.put(rec)
+                return
+            # Built for an older grammar, or the pool is already full: drop it.
+            self.generations.pop(id(rec), None)
+
+class StreamingTranscriber:
+    """
+    Wraps a KaldiRecognizer for one utterance. Call accept() for every chunk;
+    it returns True as soon as the utterance is complete, after which
+    finish() returns the full transcript.
+
+    If a grammar-restricted recognizer is given, it decodes the same audio
+    alongside the open one. Its result is preferred when it is confident,
+    contains no out-of-grammar words, and is_command(text) accepts it.
+    """
+
+    def __init__(self, rec, grammar_rec=None, is_command=None, sample_rate=16000):
+        self.rec = rec
+        self.bytes_per_second = sample_rate * 2
+        self.grammar_rec = grammar_rec
+        self.is_command = is_command
+        self.grammar_words = []
+        self.source = "open"
+        self.segments = []
+        self.last_partial = ""
+        self.stable_bytes = 0
+        self.total_bytes = 0
+        self.endpoint_reason = None
+        self.transcript = ""
+
+    def accept(self, audio):
+        """Feeds one chunk of 16-bit PCM. Returns True once the speaker is done."""
+        if self.endpoint_reason:
+            return True
+        self.total_bytes += len(audio)
+
+        if self.grammar_rec and self.grammar_rec.AcceptWaveform(audio):
+            self.grammar_words.extend(json.loads(self.grammar_rec.Result()).get('result', []))
+
+        if self.rec.AcceptWaveform(audio):
+            # Vosk detected an endpoint; a non-empty final segment means the
+            # command is complete and intent routing can start right away.
+            text = json.loads(self.rec.Result()).get('text', '')
+            self.last_partial = ""
+            self.stable_bytes = 0
+            if text:
+                print(f"Final segment: '{text}'")
+                self.segments.append(text)
+                self.endpoint_reason = "vosk endpoint"
+        else:
+            partial = json.loads(self.rec.PartialResult()).get('partial', '')
+            if partial and partial == self.last_partial:
+                self.stable_bytes += len(audio)
+            else:
+                if partial:
+                    print(f"Partial: '{partial}'")
+                self.last_partial = partial
+                self.stable_bytes = 0
+            if partial and self.stable_bytes >= STABLE_PARTIAL_SECONDS * self.bytes_per_second:
+                self.endpoint_reason = "stable partial"
+
+        if not self.endpoint_reason and self.total_bytes >= MAX_UTTERANCE_SECONDS * self.bytes_per_second:
+            self.endpoint_reason = "max length"
+        return self.endpoint_reason is not None
+
+    def end_of_speech(self):
+        """The ACU's VAD says the command is over; treat it as the endpoint."""
+        if not self.endpoint_reason:
+            self.endpoint_reason = "acu speech end"
+        return True
+
+    def finish(self):
+        """Flushes the recognizer(s) and returns the complete transcript."""
+        text = json.loads(self.rec.FinalResult()).get('text', '')
+        if text:
+            self.segments.append(text)
+        self.transcript = " ".join(self.segments).strip()
+
+        if self.grammar_rec:
+            self.grammar_words.extend(json.loads(self.grammar_rec.FinalResult()).get('result', []))
+            grammar_text = self._confident_grammar_text()
+            if grammar_text and grammar_text != self.transcript:
+                print(f"Grammar result '{grammar_text}' preferred over '{self.transcript}'.")
+                self.transcript = grammar_text
+                self.source = "grammar"
+        return self.transcript
+
+    def _confident_grammar_text(self):
+        words = [w.get('word', '') for w in self.grammar_words]
+        if not words or "[unk]" in words:
+            return None
+        if min(w.get('conf', 0.0) for w in self.grammar_words) < GRAMMAR_MIN_CONFIDENCE:
+            return None
+        text = " ".join(words)
+        if self.is_command and not self.is_command(text):
+            return None
+        return text
@@ -4,7 +4,9 @@
 import os
 import sys
 import time
-import json
+import queue
+import threading
+import wave
 import traceback
 from dotenv import load_dotenv
 from concurrent import futures
@@ -14,17 +16,32 @@ import sounddevice as sd
 import numpy as np
 import ollama
 from openai import OpenAI, Timeout
-import mysql.connector
 
-from vosk import Model, KaldiRecognizer
+from vosk import Model
 import grpc
 
 # --- Add protos directory to path ---
 PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
 sys.path.append(os.path.join(PROJECT_ROOT, 'protos'))
+sys.path.append(os.path.join(PROJECT_ROOT, 'common'))
 
 import audiostream_pb2
 import audiostream_pb2_grpc
+from metrics import REGISTRY, start_metrics_server
+from audio_cache import AudioCache, cache_key, load_phrases
+from sentences import SentenceSegmenter
+from tracing import Trace
+from audio_codec import OpusStreamDecoder, opus_available
+from inventory_db import InventoryDB
+from inventory_cache import InventoryIndex
+from response_cache import ResponseCache
+from llm_scheduler import Backend, LLMScheduler
+from sessions import SessionStore, acu_identity
+from local_llm import LocalLLM
+from intents import CLOUD, LLM, LOCAL, NUMBER_WORDS, IntentRouter
+from admission import PRIORITIES, AdmissionController
+from asr import GrammarRecognizerPool, RecognizerPool, StreamingTranscriber
+from pipeline import Job, Player, Stage, Utterance, resample
 
 # --- Configuration ---
 load_dotenv(dotenv_path=os.path.join(PROJECT_ROOT, '.env'))
@@ -41,91 +58,192 @@ SAMPLE_RATE = 16000
 HOME_DIR = os.path.expanduser('~')
 VOSK_MODEL_PATH = os.path.join(HOME_DIR, 'va-assistant/vosk-model-small-en-us-0.15')
 LOCAL_LLM_MODEL = "phi3:mini"
-conversation_history = []
+CLOUD_LLM_MODEL = "gpt-4o-mini"
+LOCAL_LLM_KEEP_ALIVE = -1  # Keep phi3 loaded between sparse voice requests (-1 = never unload)
+# Fixed per-request options; changing any of these between calls forces Ollama to reload the model.
+LOCAL_LLM_OPTIONS = {"num_ctx": 2048}
+ACK_SOUND_PATH = os.path.join(os.path.dirname(__file__), "acknowledged.wav")
+TTS_SERVER_URL = os.getenv("TTS_SERVER_URL", "http://192.168.4.225:5002")
+TTS_STREAM_URL = f"{TTS_SERVER_URL}/api/tts/stream"
+TTS_DEFAULT_SAMPLE_RATE = 24000  # XTTS v2 output rate
+PLAYBACK_SAMPLE_RATE = TTS_DEFAULT_SAMPLE_RATE  # The speaker stream runs at the TTS rate so replies aren't resampled
+BARGE_IN = True  # A new command from an ACU cuts off the reply still playing or streaming to it
+TTS_STREAM_CHUNK_BYTES = 4800    # ~100 ms of 24 kHz int16 audio
+TTS_VOICE = os.getenv("TTS_VOICE", "")  # Empty uses the TTS server's default voice
+TTS_LANGUAGE = "en"
+TTS_CACHE_BYTES = 32 * 1024 * 1024
+TTS_CACHE_DIR = os.getenv("BRAIN_TTS_CACHE_DIR")  # Unset keeps the cache in memory only
+TTS_CACHE_MAX_TEXT_CHARS = 200   # Long (LLM) answers rarely repeat; don't let them evict phrases
+COMMON_PHRASES_FILE = os.path.join(PROJECT_ROOT, 'common', 'common_phrases.txt')
+GRPC_WORKERS = 10
+# ACUs hold one connection open and ping it every 20 s while idle; accept those
+# pings instead of answering them with GOAWAY "too_many_pings".
+GRPC_SERVER_OPTIONS = [
+    ('grpc.keepalive_time_ms', 30000),
+    ('grpc.keepalive_timeout_ms', 10000),
+    ('grpc.keepalive_permit_without_calls', 1),
+    ('grpc.http2.min_recv_ping_interval_without_data_ms', 10000),
+    ('grpc.http2.max_ping_strikes', 0),
+]
+METRICS_PORT = 9102
+# Pipeline sizing: worker threads per stage and the bound on each stage's queue
+INTENT_WORKERS = 1
+GENERATION_WORKERS = 4
+SYNTHESIS_WORKERS = 4
+STAGE_QUEUE_SIZE = 8
+DB_POOL_SIZE = GENERATION_WORKERS + 1
+INVENTORY_REFRESH_SECONDS = 60  # Picks up edits made to lab_inventory outside the assistant
+SUBMIT_TIMEOUT = 2.0  # seconds a handler waits for room in the intent queue
+EMBEDDING_MODEL = "all-minilm"  # Ollama model used to embed questions for the response cache
+RESPONSE_CACHE_PATH = os.getenv("BRAIN_RESPONSE_CACHE", os.path.join(os.path.dirname(__file__), "cache", "responses"))
+RESPONSE_CACHE_ENTRIES = 512
+RESPONSE_CACHE_TTL = 24 * 3600  # Answers older than this are asked again
+RESPONSE_CACHE_THRESHOLD = 0.92  # Cosine similarity for two questions to share an answer
+LLM_HEDGING = True  # Also ask the other backend when the first is past its p90
+# Backend favoured for each query class; the scheduler overrides this when
+# the favourite is much slower or keeps failing.
+LLM_PREFERENCES = {"chat": "ollama", "general": "openai"}
+SESSION_TOKEN_BUDGET = 600   # Recent turns kept verbatim per ACU, in estimated tokens
+SESSION_SUMMARY_CHARS = 400  # Size of the summary that older turns are folded into
+SESSION_IDLE_SECONDS = 15 * 60
+GRAMMAR_RECOGNITION = True  # Decode skill commands against a restricted vocabulary as well
+# Vosk still hears this much of every pause the ACU marks as silence, so
+# gaps between words stay in the audio and its own endpoints can fire;
+# only the rest of a long pause is skipped.
+SILENCE_FEED_SECONDS = 0.5
+# Admission control for a fleet of ACUs. Two workers stay free of streams so
+# a turned-away ACU still gets its "busy" answer promptly.
+MAX_STREAMS = GRPC_WORKERS - 2
+MAX_STREAMS_PER_ACU = 2
+# LLM and cloud replies hold a synthesis worker for their whole streamed
+# generation, so together they stay one short of SYNTHESIS_WORKERS and a
+# worker is always free for local skills.
+LONG_JOB_LIMIT = SYNTHESIS_WORKERS - 1
+JOB_LIMITS = {LLM: 1, CLOUD: LONG_JOB_LIMIT - 1}  # Local skills are never capped
+BUSY_REPLY = "Sorry, I'm busy with other requests right now. Please try again in a moment."
 
 # --- Component Initialization ---
 client = OpenAI(api_key=api_key, timeout=20.0)
-mysql_conn = None
-mysql_cursor = None
+router = IntentRouter()
+local_llm = LocalLLM(LOCAL_LLM_MODEL, LOCAL_LLM_KEEP_ALIVE, LOCAL_LLM_OPTIONS)
+sessions = SessionStore(SESSION_TOKEN_BUDGET, SESSION_SUMMARY_CHARS, SESSION_IDLE_SECONDS)
+admission = AdmissionController(MAX_STREAMS, MAX_STREAMS_PER_ACU, JOB_LIMITS)
+llm_scheduler = LLMScheduler([
+    # The LLM admission slot is the Ollama slot, whichever cost class the question has.
+    Backend("ollama", local_llm.stream, default_latency=1.5,
+            admit=lambda: admission.admit_job(LLM), release=lambda: admission.release_job(LLM)),
+    Backend("openai", lambda messages: openai_stream(messages), default_latency=1.0),
+], LLM_PREFERENCES, hedging=LLM_HEDGING)
+response_cache = None
+inventory_db = None
+inventory_index = None
 vosk_model = None
+recognizers = None
+grammar_recognizers = None
+ack_sound = None  # (sample_rate, pcm) of acknowledged.wav, loaded once at startup
+player = None
+intent_stage = None
+tts_cache = AudioCache(TTS_CACHE_BYTES, TTS_CACHE_DIR)
+
+# --- Latency Histograms ---
+wake_to_first_byte = REGISTRY.histogram("brain_wake_to_first_byte_seconds", "Wake word on the ACU to the first audio chunk reaching the Brain.")
+asr_finalize = REGISTRY.histogram("brain_asr_finalize_seconds", "End of speech to the final transcript.")
+llm_ttft = REGISTRY.histogram("brain_llm_ttft_seconds", "Start of generation to the first token of an LLM answer, by cost class.")
+tts_render = REGISTRY.histogram("brain_tts_first_audio_seconds", "TTS server request to its first PCM chunk, per sentence not in the local cache.")
+time_to_first_audio = REGISTRY.histogram("brain_time_to_first_audio_seconds", "End of speech to the first reply audio played or sent to the ACU.")
+wake_to_first_audio = REGISTRY.histogram("brain_wake_to_first_audio_seconds", "Wake word on the ACU to the first reply audio played or sent to it.")
 
 # --- Core AI and Skill Functions ---
-def speak(text):
+def stream_tts(text, request_id=None):
     """
-    Sends text to the dedicated TTS server, saves the returned audio,
-    and plays it using aplay.
+    Opens a streaming request to the TTS server. Returns the sample rate and
+    a generator of whole-sample PCM chunks as the server renders them.
     """
-    print("\n=== Starting TTS Request ===")
+    payload = {'text': text}
+    if TTS_VOICE:
+        payload['speaker'] = TTS_VOICE
+    headers = {'X-Request-ID': request_id} if request_id else None
+    response = requests.post(TTS_STREAM_URL, json=payload, headers=headers, stream=True, timeout=20.0)
+    if response.status_code != 200:
+        message = f"TTS server returned {response.status_code}: {response.text}"
+        response.close()
+        raise requests.exceptions.HTTPError(message)
+    sample_rate = int(response.headers.get('X-Sample-Rate', TTS_DEFAULT_SAMPLE_RATE))
+
+    def chunks():
+        remainder = b''
+        with response:
+            for data in response.iter_content(chunk_size=TTS_STREAM_CHUNK_BYTES):
+                data = remainder + data
+                # HTTP chunks can split a 16-bit sample; hold back the odd byte.
+                cut = len(data) - (len(data) % 2)
+                remainder = data[cut:]
+                if cut:
+                    yield data[:cut]
+
+    return sample_rate, chunks()
+
+def synthesize_into(text, utterance, trace=None):
+    """
+    Streams synthesized speech for text into an Utterance. Short phrases are
+    served from the local cache when possible. The caller closes the utterance.
+    """
+    if utterance.cancelled:
+        return
     print(f"TTS Text: {text}")
-    tts_server_url = "http://192.168.4.225:5002/api/tts"
-    local_audio_file = "response.wav"
-    
-    try:
-        print(f"Sending request to TTS server at {tts_server_url}")
-        payload = {'text': text}
-        print(f"Request payload: {payload}")
-        
-        response = requests.post(tts_server_url, json=payload, timeout=20.0)
-        print(f"Received response: Status {response.status_code}")
-        print(f"Response headers: {dict(response.headers)}")
-        print(f"Response content length: {len(response.content)} bytes")
-        print(f"Content type: {response.headers.get('content-type', 'Not specified')}")
-
-        if response.status_code == 200:
-            print(f"Writing audio data to {local_audio_file}")
-            with open(local_audio_file, 'wb') as f:
-                f.write(response.content)
-            
-            if os.path.exists(local_audio_file):
-                file_size = os.path.getsize(local_audio_file)
-                print(f"Audio file created successfully. Size: {file_size} bytes")
-                
-                print("--- Playing audio file now... ---")
-                try:
-                    result = subprocess.run(["aplay", "-v", local_audio_file], 
-                                         capture_output=True, text=True)
-                    print(f"aplay stdout: {result.stdout}")
-                    print(f"aplay stderr: {result.stderr}")
-                    if result.returncode != 0:
-                        print(f"aplay returned non-zero exit code: {result.returncode}")
-                except subprocess.SubprocessError as e:
-                    print(f"Error running aplay: {e}")
-                
-                print("--- Finished playing audio ---")
-                os.remove(local_audio_file)
-                print(f"Removed temporary audio file: {local_audio_file}")
-            else:
-                print(f"ERROR: Audio file {local_audio_file} was not created!")
-        else:
-            print(f"Error from TTS Server: {response.status_code}")
-            print(f"Error details: {response.text}")
-            try:
-                print(f"Full response content: {response.content.decode('utf-8')}")
-            except:
-                print(f"Raw response content: {response.content}")
+    key = cache_key(text, TTS_VOICE or "default", TTS_LANGUAGE)
+    cached = tts_cache.get(key)
+    if cached is not None:
+        print("--- TTS cache hit ---")
+        sample_rate, pcm = cached
+        utterance.put(pcm, sample_rate, text)
+        return
 
+    start_time = time.monotonic()
+    cacheable = len(text) <= TTS_CACHE_MAX_TEXT_CHARS
+    rendered = []
+    try:
+        sample_rate, chunks = stream_tts(text, trace.request_id if trace else None)
+        first_audio = True
+        for pcm in chunks:
+            if utterance.cancelled:
+                chunks.close()  # Drops the TTS connection; nobody will hear the rest
+                return
+            if first_audio:
+                render_time = time.monotonic() - start_time
+                tts_render.observe(render_time)
+                print(f"--- First audio after {render_time:.2f}s ---")
+            utterance.put(pcm, sample_rate, text if first_audio else None)
+            first_audio = False
+            if cacheable:
+                rendered.append(pcm)
+        if cacheable and rendered:
+            tts_cache.put(key, sample_rate, b''.join(rendered))
     except requests.exceptions.RequestException as e:
-        print(f"Could not connect to TTS server: {e}")
+        print(f"Could not get audio from TTS server: {e}")
         print(f"Request exception details: {traceback.format_exc()}")
-    except Exception as e:
-        print(f"An error occurred in the speak function: {e}")
-        print(f"Exception details: {traceback.format_exc()}")
-    
-    print("=== TTS Request Complete ===\n")
 
-def transcribe_audio_bytes(command_bytes):
-    print("Processing command...")
-    try:
-        rec = KaldiRecognizer(vosk_model, SAMPLE_RATE)
-        rec.AcceptWaveform(command_bytes)
-        result = json.loads(rec.FinalResult())
-        return result.get('text', '')
-    except Exception as e:
-        print(f"An error occurred during transcription: {e}")
-        traceback.print_exc()
-    return ""
+def cached_utterance(text):
+    """A closed Utterance of text from the TTS cache, or None if it isn't cached."""
+    cached = tts_cache.get(cache_key(text, TTS_VOICE or "default", TTS_LANGUAGE))
+    return Utterance(*cached) if cached is not None else None
 
-def get_cpu_temperature():
+def prewarm_tts_cache(path):
+    """Fetches the common phrase list from the TTS server into the local cache."""
+    phrases = load_phrases(path)
+    for phrase in phrases:
+        key = cache_key(phrase, TTS_VOICE or "default", TTS_LANGUAGE)
+        if key in tts_cache:
+            continue
+        try:
+            sample_rate, chunks = stream_tts(phrase)
+            tts_cache.put(key, sample_rate, b''.join(chunks))
+        except requests.exceptions.RequestException as e:
+            print(f"Could not pre-render '{phrase}': {e}")
+            return
+    print(f"TTS cache warmed with {len(phrases)} phrase(s): {tts_cache.stats()}")
+
+def get_cpu_temperature(transcript=None):
     try:
         temp_str = subprocess.check_output(['cat', '/sys/class/thermal/thermal_zone0/temp']).decode('utf-8')
         temp_c = int(temp_str) / 1000.0
@@ -134,150 +252,536 @@ def get_cpu_temperature():
         print(f"Could not read CPU temp: {e}")
         return "I was unable to read the CPU temperature."
 
-def local_query(transcript):
-    global conversation_history
-    if len(conversation_history) > 6: conversation_history = conversation_history[-6:]
-    conversation_history.append({"role": "user", "content": transcript})
-    response = ollama.chat(model=LOCAL_LLM_MODEL, messages=conversation_history)
-    answer = response['message']['content']
-    conversation_history.append({"role": "assistant", "content": answer})
-    return answer
-
-def local_data_query(transcript):
-    if "inventory" in transcript.lower():
-        parts = transcript.lower().split("inventory for ")
-        item_name = parts[1].strip() if len(parts) > 1 else "all"
-        try:
-            if item_name == "all":
-                query = "SELECT item, quantity FROM lab_inventory"
-                mysql_cursor.execute(query)
-            else:
-                query = "SELECT item, quantity FROM lab_inventory WHERE item LIKE %s"
-                mysql_cursor.execute(query, (f"%{item_name}%",))
-            results = mysql_cursor.fetchall()
-            mysql_conn.commit()
-            if results:
-                response = ", ".join([f"{row[1]} {row[0]}" for row in results])
-                return f"Current inventory shows: {response}."
-            else:
-                return f"No inventory found for {item_name}."
-        except Exception as e:
-            print(f"A database error occurred: {e}")
-            return "Sorry, I had a problem querying the database."
-    return "No local data query matched."
+def embed_text(text):
+    return ollama.embeddings(model=EMBEDDING_MODEL, prompt=text, keep_alive=LOCAL_LLM_KEEP_ALIVE)['embedding']
+
+def cached_stream(namespace, transcript, produce):
+    """Serves an LLM answer from the response cache when possible, else streams produce()."""
+    if response_cache is None:
+        return produce()
+    return response_cache.through(namespace, transcript, produce)
 
-def add_to_inventory(transcript):
-    """Parses a command to add an item to the inventory and updates the database."""
+def openai_stream(messages):
+    stream = client.chat.completions.create(model=CLOUD_LLM_MODEL, messages=messages, stream=True)
     try:
-        words = transcript.lower().split()
-        add_index = words.index("add")
-        to_index = words.index("to")
-        
-        num_map = {"a": 1, "an": 1, "one": 1, "two": 2, "three": 3, "four": 4, "five": 5, 
-                   "six": 6, "seven": 7, "eight": 8, "nine": 9, "ten": 10}
-        
-        quantity_word = words[add_index + 1]
-        quantity = num_map.get(quantity_word, int(quantity_word) if quantity_word.isdigit() else 1)
-        
-        item_name = " ".join(words[add_index + 2 : to_index])
-        
-        if not item_name:
-            return "I didn't catch the item name. Please try again."
-
-        query = """
-            INSERT INTO lab_inventory (item, quantity) 
-            VALUES (%s, %s) 
-            ON DUPLICATE KEY UPDATE quantity = quantity + VALUES(quantity)
-        """
-        mysql_cursor.execute(query, (item_name, quantity))
-        mysql_conn.commit()
-        
-        plural = "s" if quantity > 1 else ""
-        return f"Okay, I've added {quantity} {item_name}{plural} to the inventory."
+        for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+    finally:
+        stream.close()  # Drops the HTTP connection if the other backend won
+
+def llm_query(transcript, query_class, session=None, reserved=()):
+    """
+    Streams an answer from the response cache or from whichever LLM backend
+    the scheduler picks. "chat" questions carry the ACU's conversation
+    history; every answered question is added to it. Questions asked with
+    history are never cached. reserved is passed on to the scheduler.
+    """
+    if query_class == "chat" and session:
+        messages = session.messages(transcript)
+    else:
+        messages = [{"role": "user", "content": transcript}]
+
+    produce = lambda: llm_scheduler.ask(query_class, messages, reserved)
+    if len(messages) > 1:
+        # The answer depends on this ACU's conversation so far; cached under the
+        # question alone it would be served to other ACUs and conversations.
+        answer = produce()
+    else:
+        answer = cached_stream(query_class, transcript, produce)
+
+    parts = []
+    try:
+        for piece in answer:
+            parts.append(piece)
+            yield piece
+    except Timeout:
+        print("LLM request timed out.")
+        yield " Sorry, the cloud is not responding quickly enough."
+    except Exception as e:
+        print(f"An error occurred while querying the language models: {e}")
+        yield " Sorry, I'm having trouble connecting to the cloud at the moment."
+    if session and parts:
+        session.add_turn(transcript, "".join(parts).strip())
+
+def local_query(transcript, session=None):
+    # Admitted as an LLM job, so this question already holds the Ollama slot.
+    return llm_query(transcript, "chat", session, reserved=("ollama",))
+
+def local_data_query(transcript, item=None):
+    """Answers an inventory question; item is the name slot from the router, None for everything."""
+    item_name = item or "all"
+    try:
+        if not inventory_index.ready:
+            # The snapshot failed to load at startup; fall back to querying MySQL.
+            results = inventory_db.fetch_all() if item_name == "all" else inventory_db.find(item_name)
+        elif item_name == "all":
+            results = inventory_index.all()
+        else:
+            results = inventory_index.lookup(item_name)
+        if results:
+            response = ", ".join([f"{row[1]} {row[0]}" for row in results])
+            return f"Current inventory shows: {response}."
+        else:
+            return f"No inventory found for {item_name}."
+    except Exception as e:
+        print(f"A database error occurred: {e}")
+        return "Sorry, I had a problem querying the database."
 
-    except (ValueError, IndexError):
+def add_to_inventory(transcript, quantity=1, item=None):
+    """Adds the item and quantity slots extracted by the router to the database."""
+    if not item:
         return "I didn't understand the format. Please say something like 'add one item to the inventory'."
+    try:
+        inventory_db.add(item, quantity)
+        inventory_index.apply_add(item, quantity)
+
+        plural = "s" if quantity > 1 else ""
+        return f"Okay, I've added {quantity} {item}{plural} to the inventory."
     except Exception as e:
         print(f"A database error occurred during insert: {e}")
         return "Sorry, I had a problem updating the database."
 
-def api_query(transcript):
+def api_query(transcript, session=None):
+    return llm_query(transcript, "general", session)
+
+# Skill name (see intents.SKILLS) -> function called with the transcript and its slots
+SKILL_HANDLERS = {
+    "add_inventory": add_to_inventory,
+    "inventory_query": local_data_query,
+    "cpu_temperature": get_cpu_temperature,
+    "local_chat": local_query,
+    "cloud_query": api_query,
+}
+
+def choose_skill(transcript, session=None):
+    """
+    Routes a transcript and returns (zero-argument skill callable, cost class).
+    LLM skills also get the conversation session of the ACU that asked.
+    """
+    if not transcript:
+        return (lambda: "I didn't catch that."), LOCAL
+
+    print(f"Heard command: '{transcript}'")
+    intent = router.route(transcript)
+    print(f"Routed to {intent.name} ({intent.cost}) with {intent.slots}.")
+    handler = SKILL_HANDLERS[intent.name]
+    slots = dict(intent.slots)
+    if intent.cost != LOCAL:
+        slots["session"] = session
+    return (lambda: handler(transcript, **slots)), intent.cost
+
+def grammar_phrases(item_names):
+    """Phrase list for the restricted recognizer: skill phrases, number words and item names."""
+    return router.phrases() + list(NUMBER_WORDS) + list(item_names)
+
+def is_skill_command(text):
+    """True if text would be routed to one of the local (non-LLM) skills."""
+    return router.route(text).cost == LOCAL
+
+def on_inventory_change(item_names):
+    # Rebuilding compiles a new grammar for every pooled recognizer; keep it off the caller's thread.
+    threading.Thread(target=grammar_recognizers.set_phrases, args=(grammar_phrases(item_names),),
+                     name="grammar-rebuild", daemon=True).start()
+
+def new_transcriber():
+    grammar_rec = grammar_recognizers.acquire() if grammar_recognizers else None
+    return StreamingTranscriber(recognizers.acquire(), grammar_rec, is_command=is_skill_command,
+                                sample_rate=SAMPLE_RATE)
+
+class ChunkDecoder:
+    """Turns the AudioChunk messages of one stream into PCM, whatever their codec."""
+
+    def __init__(self):
+        self.opus = None
+
+    def decode(self, chunk):
+        if chunk.codec == audiostream_pb2.OPUS:
+            if self.opus is None:
+                self.opus = OpusStreamDecoder(SAMPLE_RATE)
+            return self.opus.decode(chunk.opus_packets)
+        return chunk.audio_chunk
+
+# --- Pipeline Stage Handlers ---
+def intent_handler(job):
+    job.skill, job.cost = choose_skill(job.transcript, sessions.get(job.acu_id))
+    job.trace.mark("intent")
+    if admission.admit_job(job.cost):
+        job.on_done(lambda job, cost=job.cost: admission.release_job(cost))
+    else:
+        # Answer at once rather than queue behind requests that are already slow.
+        print(f"Too many {job.cost} requests in flight, answering busy.")
+        job.skill, job.cost = (lambda: BUSY_REPLY), LOCAL
+    job.priority = PRIORITIES[job.cost]
+
+def generation_handler(job):
+    """
+    Runs the skill. Skills return either the full reply or an iterator of
+    streamed text; streamed replies are cut into sentences and handed to
+    synthesis one at a time while generation continues.
+    """
+    job.trace.mark("generation")
+    result = job.skill()
+    if isinstance(result, str):
+        job.trace.mark("first_token")
+        job.response = result
+        job.sentences.put(result)
+        job.sentences.put(None)
+        print(f"Response: {job.response}")
+        return
+
+    job.forward()
+    segmenter = SentenceSegmenter()
+    parts = []
     try:
-        print("Querying OpenAI API...")
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[{"role": "user", "content": transcript}]
-        )
-        return response.choices[0].message.content
-    except Timeout:
-        print("OpenAI API request timed out.")
-        return "Sorry, the cloud is not responding quickly enough."
-    except Exception as e:
-        print(f"An error occurred with the OpenAI API: {e}")
-        return "Sorry, I'm having trouble connecting to the cloud at the moment."
+        for piece in result:
+            if job.cancelled:
+                print("Reply interrupted, stopping generation.")
+                close = getattr(result, 'close', None)
+                if close:
+                    close()  # Closes the LLM stream; a partial answer isn't cached
+                break
+            if job.trace.mark("first_token") and job.cost != LOCAL:
+                llm_ttft.observe(job.trace.elapsed("generation", "first_token"), cost=job.cost)
+            parts.append(piece)
+            for sentence in segmenter.feed(piece):
+                job.sentences.put(sentence)
+        tail = segmenter.flush()
+        if tail:
+            job.sentences.put(tail)
+    finally:
+        job.response = "".join(parts).strip()
+        job.sentences.put(None)
+    print(f"Response: {job.response}")
+
+def synthesis_handler(job):
+    if job.play_locally:
+        job.utterance.on_start = lambda: mark_first_audio(job.trace)
+        player.play(job.utterance)
+    try:
+        while True:
+            sentence = job.sentences.get()
+            if sentence is None or job.cancelled:
+                break
+            synthesize_into(sentence, job.utterance, job.trace)
+    finally:
+        job.utterance.close()
+        job.finish()
+
+def build_pipeline():
+    """Creates the player and the intent -> generation -> synthesis stages."""
+    global player, intent_stage
+    player = Player(PLAYBACK_SAMPLE_RATE)
+    synthesis_stage = Stage("synthesis", synthesis_handler, SYNTHESIS_WORKERS, STAGE_QUEUE_SIZE)
+    generation_stage = Stage("generation", generation_handler, GENERATION_WORKERS, STAGE_QUEUE_SIZE,
+                             next_stage=synthesis_stage)
+    intent_stage = Stage("intent", intent_handler, INTENT_WORKERS, STAGE_QUEUE_SIZE,
+                         next_stage=generation_stage)
+
+    depth = REGISTRY.gauge("brain_pipeline_queue_depth", "Jobs waiting in each pipeline stage queue.")
+    busy = REGISTRY.gauge("brain_pipeline_busy_workers", "Workers currently running a job in each stage.")
+    for stage in (intent_stage, generation_stage, synthesis_stage):
+        depth.set_function(stage.depth, stage=stage.name)
+        busy.set_function(stage.busy_workers, stage=stage.name)
+    depth.set_function(player.depth, stage="playback")
+    busy.set_function(lambda: int(player.playing), stage="playback")
+    underruns = REGISTRY.counter("brain_playback_underruns_total", "Audio callbacks that ran out of reply audio mid-utterance.")
+    underruns.set_function(lambda: player.underruns)
+
+def mark_first_audio(trace):
+    """Called when a reply's first audio is played or sent; records the end-to-end latencies."""
+    if not trace.mark("first_audio"):
+        return
+    since_speech = trace.elapsed("endpoint", "first_audio")
+    if since_speech is not None:
+        time_to_first_audio.observe(since_speech)
+    if trace.from_acu:
+        wake_to_first_audio.observe(trace.elapsed("start", "first_audio"))
+    print(f"Trace {trace.summary()}")
+
+def ack_utterance(acu_id=None):
+    return Utterance(*ack_sound, acu_id=acu_id)
+
+def load_wav(path):
+    """Reads a WAV file into memory as (sample_rate, 16-bit mono PCM bytes)."""
+    with wave.open(path, 'rb') as wav_file:
+        sample_rate = wav_file.getframerate()
+        channels = wav_file.getnchannels()
+        if wav_file.getsampwidth() != 2:
+            raise ValueError(f"{path} must be 16-bit PCM")
+        samples = np.frombuffer(wav_file.readframes(wav_file.getnframes()), dtype='<i2')
+    if channels > 1:
+        samples = samples.reshape(-1, channels).mean(axis=1).astype('<i2')
+    return sample_rate, samples.tobytes()
 
 # --- gRPC Server Implementation ---
+def status_event(state, message=""):
+    return audiostream_pb2.ServerEvent(status=audiostream_pb2.StatusEvent(state=state, message=message))
+
+def transcript_event(text, is_final):
+    return audiostream_pb2.ServerEvent(transcript=audiostream_pb2.TranscriptEvent(text=text, is_final=is_final))
+
+def audio_event(pcm, sample_rate):
+    return audiostream_pb2.ServerEvent(audio=audiostream_pb2.AudioFrame(pcm=pcm, sample_rate=sample_rate))
+
+def request_trace(context):
+    """Continues the trace the ACU started at the wake word (x-request-id, x-wake-time)."""
+    return Trace.from_metadata(dict(context.invocation_metadata()))
+
+active_streams = REGISTRY.gauge("brain_active_streams", "ACU streams currently in the ASR stage.")
+skipped_chunks = REGISTRY.counter("brain_asr_skipped_chunks_total", "Silence chunks past SILENCE_FEED_SECONDS that ASR skipped.")
+rejected_jobs = REGISTRY.counter("brain_rejected_jobs_total", "Commands dropped because the pipeline was full.")
+
 class AudioStreamerServicer(audiostream_pb2_grpc.AudioStreamerServicer):
+    def __init__(self):
+        self.streams = 0
+        self.jobs = set()  # Jobs still working on a reply, so barge-in can cancel them
+        self.lock = threading.Lock()
+        active_streams.set_function(lambda: self.streams)
+
+    def transcribe(self, request_iterator, transcriber, trace, on_endpoint=None):
+        """
+        Feeds the incoming stream into transcriber, yielding each new partial
+        transcript. on_endpoint is called as soon as the speaker is done,
+        before the recognizer is flushed. The recognizer goes back to the
+        pool afterwards.
+        """
+        with self.lock:
+            self.streams += 1
+        try:
+            sent_partial = ""
+            decoder = ChunkDecoder()
+            silence_bytes = 0  # Length of the current run of ACU-marked silence
+            for chunk in request_iterator:
+                if trace.mark("first_byte") and trace.from_acu:
+                    wake_to_first_byte.observe(trace.elapsed("start", "first_byte"))
+                # Opus chunks are always decoded to keep the decoder's state continuous.
+                audio = decoder.decode(chunk)
+                if chunk.vad == audiostream_pb2.VAD_SILENCE:
+                    silence_bytes += len(audio)
+                else:
+                    silence_bytes = 0
+                if silence_bytes > SILENCE_FEED_SECONDS * SAMPLE_RATE * 2:
+                    # Deep into a pause; Vosk has already heard enough of it to endpoint.
+                    skipped_chunks.inc()
+                    done = False
+                else:
+                    done = transcriber.accept(audio) if audio else False
+                if chunk.speech_end:
+                    done = transcriber.end_of_speech()
+                if transcriber.last_partial and transcriber.last_partial != sent_partial:
+                    sent_partial = transcriber.last_partial
+                    yield sent_partial
+                if done:
+                    print(f"End of utterance detected on the Brain ({transcriber.endpoint_reason}).")
+                    break
+            trace.mark("endpoint")
+            if on_endpoint:
+                on_endpoint()
+            transcriber.finish()
+            trace.mark("transcript")
+            asr_finalize.observe(trace.elapsed("endpoint", "transcript"))
+        finally:
+            recognizers.release(transcriber.rec)
+            if transcriber.grammar_rec:
+                grammar_recognizers.release(transcriber.grammar_rec)
+            with self.lock:
+                self.streams -= 1
+
+    def submit(self, job):
+        try:
+            intent_stage.put(job, timeout=SUBMIT_TIMEOUT)
+            return True
+        except queue.Full:
+            print("Pipeline is full, dropping command.")
+            rejected_jobs.inc()
+            return False
+
+    def interrupt_replies(self, acu_id):
+        """Barge-in: cancels the replies to acu_id still being generated, synthesized or played."""
+        with self.lock:
+            jobs = [job for job in self.jobs if job.acu_id == acu_id]
+        for job in jobs:
+            job.cancel()
+        player.interrupt(acu_id)
+
+    def track_job(self, job):
+        with self.lock:
+            self.jobs.add(job)
+        job.on_done(self.forget_job)
+
+    def forget_job(self, job):
+        with self.lock:
+            self.jobs.discard(job)
+
+    def play_busy(self):
+        utterance = cached_utterance(BUSY_REPLY)
+        if utterance:
+            player.play(utterance)
+        return audiostream_pb2.StreamReceipt(status_message="Brain is busy.")
+
+    def busy_events(self):
+        State = audiostream_pb2.StatusEvent
+        yield status_event(State.ERROR, "Brain is busy.")
+        utterance = cached_utterance(BUSY_REPLY)
+        if utterance:
+            yield status_event(State.SPEAKING, BUSY_REPLY)
+            for sample_rate, pcm, _ in utterance:
+                yield audio_event(pcm, sample_rate)
+        yield status_event(State.DONE)
+
+    def GetCapabilities(self, request, context):
+        codecs = [audiostream_pb2.PCM_S16LE]
+        if opus_available():
+            codecs.append(audiostream_pb2.OPUS)
+        return audiostream_pb2.Capabilities(codecs=codecs, sample_rate=SAMPLE_RATE)
+
     def StreamAudio(self, request_iterator, context):
         print("\nConnection received from an ACU...")
-        
-        # 1. Set up the streaming transcriber
-        rec = KaldiRecognizer(vosk_model, SAMPLE_RATE)
-        
-        # 2. Process audio chunks from the stream
-        for chunk in request_iterator:
-            if rec.AcceptWaveform(chunk.audio_chunk):
-                # This block is for partial results, which we are ignoring for now
-                pass
-
-        # 3. Get the final transcription after the stream is closed
-        result = json.loads(rec.FinalResult())
-        transcript = result.get('text', '')
-        
-        # --- The rest of the logic remains the same ---
-
-        # We are using a pre-generated file for this now for speed
-        subprocess.run(["aplay", os.path.join(os.path.dirname(__file__), "acknowledged.wav")], check=True, 
-                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-        
-        if transcript:
-            print(f"Heard command: '{transcript}'")
-            # --- The full intent parser ---
-            if "add" in transcript.lower() and "inventory" in transcript.lower():
-                response = add_to_inventory(transcript)
-            elif "inventory" in transcript.lower():
-                response = local_data_query(transcript)
-            elif "temperature" in transcript.lower():
-                response = get_cpu_temperature()
-            elif any(kw in transcript.lower() for kw in ["who are you", "what can you do"]):
-                response = local_query(transcript)
-            else:
-                response = api_query(transcript)
-            
-            print(f"Response: {response}")
-            speak(response)
-        else:
-            speak("I didn't catch that.")
-        
-        return audiostream_pb2.StreamReceipt(status_message="Audio processed successfully.")
+        interrupted = False
+
+        def barge_in():
+            # Someone is talking over the reply; stop it and what's queued behind it.
+            nonlocal interrupted
+            if BARGE_IN and not interrupted:
+                interrupted = True
+                self.interrupt_replies(acu_id)
+
+        # ASR runs on this worker; the ack plays while the recognizer finalizes.
+        def play_ack():
+            if transcriber.segments or transcriber.last_partial:
+                barge_in()
+            if ack_sound:
+                player.play(ack_utterance(acu_id))
+
+        acu_id = acu_identity(context)
+        trace = request_trace(context)
+        with admission.stream(acu_id) as admitted:
+            if not admitted:
+                return self.play_busy()
+            transcriber = new_transcriber()
+            for partial in self.transcribe(request_iterator, transcriber, trace, on_endpoint=play_ack):
+                barge_in()  # Only once an admitted stream has produced words
+        transcript = transcriber.transcript
+
+        # Everything after ASR runs in the pipeline; this worker is free again
+        # as soon as the job is queued, not when playback ends.
+        job = Job(transcript, acu_id=acu_id, trace=trace)
+        self.track_job(job)
+        if not self.submit(job):
+            self.forget_job(job)
+            return self.play_busy()
+        return audiostream_pb2.StreamReceipt(status_message="Command accepted.")
+
+    def Converse(self, request_iterator, context):
+        """
+        Bidirectional variant of StreamAudio: transcripts, status and the reply
+        audio are streamed back so the ACU can play the answer itself.
+        """
+        print("\nConversation stream received from an ACU...")
+        State = audiostream_pb2.StatusEvent
+
+        acu_id = acu_identity(context)
+        trace = request_trace(context)
+        interrupted = False
+        with admission.stream(acu_id) as admitted:
+            if not admitted:
+                yield from self.busy_events()
+                return
+            transcriber = new_transcriber()
+            for partial in self.transcribe(request_iterator, transcriber, trace):
+                if BARGE_IN and not interrupted:
+                    # Talking over an earlier reply to this ACU ends that reply's stream.
+                    interrupted = True
+                    self.interrupt_replies(acu_id)
+                yield transcript_event(partial, is_final=False)
+
+        yield status_event(State.ENDPOINT_DETECTED, transcriber.endpoint_reason or "stream closed")
+        transcript = transcriber.transcript
+        yield transcript_event(transcript, is_final=True)
+
+        if ack_sound:
+            yield audio_event(ack_sound[1], ack_sound[0])
+
+        job = Job(transcript, play_locally=False, acu_id=acu_id, trace=trace)
+        self.track_job(job)
+        if not self.submit(job):
+            self.forget_job(job)
+            yield from self.busy_events()
+            return
+
+        def hang_up():
+            if not job.done:
+                job.cancel()  # The ACU went away mid-reply; stop working on an answer no one will hear
+        context.add_callback(hang_up)
+
+        yield status_event(State.PROCESSING)
+        for sample_rate, pcm, text in job.utterance:
+            if text is not None:
+                # Sent as each sentence starts; the full reply may still be generating.
+                yield status_event(State.SPEAKING, text)
+                mark_first_audio(trace)
+            yield audio_event(pcm, sample_rate)
+
+        if job.error is not None:
+            yield status_event(State.ERROR, "Sorry, something went wrong.")
+        yield status_event(State.DONE)
 
 # --- Main Server Function ---
 def serve():
-    global mysql_conn, mysql_cursor, vosk_model
+    global inventory_db, inventory_index, vosk_model, recognizers, grammar_recognizers, ack_sound, response_cache
     try:
-        mysql_conn = mysql.connector.connect(
-            host=mysql_host, user=mysql_user, password=mysql_password, database=mysql_db
-        )
-        mysql_cursor = mysql_conn.cursor()
-        print("MySQL connection successful.")
+        response_cache = ResponseCache(embed_text, RESPONSE_CACHE_ENTRIES, RESPONSE_CACHE_TTL,
+                                       RESPONSE_CACHE_THRESHOLD, RESPONSE_CACHE_PATH)
+        response_cache.start_autosave()
+        sessions.start_eviction()
+        inventory_db = InventoryDB(mysql_host, mysql_user, mysql_password, mysql_db, pool_size=DB_POOL_SIZE)
+        print(f"MySQL connection pool ready ({DB_POOL_SIZE} connections).")
+        inventory_index = InventoryIndex(inventory_db, INVENTORY_REFRESH_SECONDS)
+        try:
+            inventory_index.refresh()
+            print(f"Inventory snapshot loaded ({len(inventory_index.items)} items).")
+        except Exception as e:
+            print(f"Could not load the inventory snapshot, will query MySQL directly: {e}")
+        inventory_index.start_refresh()
 
         print("Loading Vosk ASR model...")
         if not os.path.exists(VOSK_MODEL_PATH):
             raise FileNotFoundError(f"Vosk model not found at {VOSK_MODEL_PATH}")
         vosk_model = Model(VOSK_MODEL_PATH)
         print("Vosk model loaded.")
+        recognizers = RecognizerPool(vosk_model, SAMPLE_RATE, GRPC_WORKERS)
+        warm_up_start = time.monotonic()
+        recognizers.warm_up()
+        print(f"{GRPC_WORKERS} recognizers built and warmed up in {time.monotonic() - warm_up_start:.2f}s.")
+        if GRAMMAR_RECOGNITION:
+            item_names = [item for item, _ in inventory_index.all()]
+            grammar_recognizers = GrammarRecognizerPool(vosk_model, SAMPLE_RATE, GRPC_WORKERS,
+                                                        grammar_phrases(item_names))
+            grammar_recognizers.warm_up()
+            inventory_index.add_listener(on_inventory_change)
+            print(f"Command grammar recognizers ready ({len(item_names)} inventory items).")
+
+        try:
+            sample_rate, pcm = load_wav(ACK_SOUND_PATH)
+            # Converted to the speaker's rate once, so playing it is only a copy.
+            ack_sound = (PLAYBACK_SAMPLE_RATE, resample(pcm, sample_rate, PLAYBACK_SAMPLE_RATE))
+        except (OSError, ValueError, wave.Error) as e:
+            print(f"Could not load {ACK_SOUND_PATH}, continuing without an ack sound: {e}")
+
+        try:
+            local_llm.warm_up()
+            local_llm.start_keep_resident()
+        except Exception as e:
+            print(f"Could not warm up the local model, the first question will load it: {e}")
+
+        build_pipeline()
+        threading.Thread(target=prewarm_tts_cache, args=(COMMON_PHRASES_FILE,),
+                         name="tts-prewarm", daemon=True).start()
+        start_metrics_server(METRICS_PORT)
+        print(f"Pipeline metrics available at http://0.0.0.0:{METRICS_PORT}/metrics")
 
-        server = grpc.server(futures.ThreadPoolExecutor(max_workers=10))
+        server = grpc.server(futures.ThreadPoolExecutor(max_workers=GRPC_WORKERS), options=GRPC_SERVER_OPTIONS)
         audiostream_pb2_grpc.add_AudioStreamerServicer_to_server(AudioStreamerServicer(), server)
         server.add_insecure_port('[::]:50051')
         server.start()
@@ -289,10 +793,11 @@ def serve():
         print(f"An unexpected error occurred:")
         traceback.print_exc()
     finally:
-        if mysql_conn and mysql_conn.is_connected():
-            mysql_cursor.close()
-            mysql_conn.close()
-            print("MySQL connection closed.")
+        if response_cache:
+            response_cache.save()
+        if inventory_db:
+            for name, (count, mean, worst) in inventory_db.timing_summary().items():
+                print(f"DB '{name}': {count} queries, mean {mean * 1000:.1f} ms, max {worst * 1000:.1f} ms")
 
 if __name__ == '__main__':
     serve()
\ No newline at end of file
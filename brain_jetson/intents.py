@@ -0,0 +1,170 @@
+# Filename: brain_jetson/intents.py
+# Skill registry and intent router. Every skill declares the phrasings it
+# answers to as regular expressions with named slots; all of them are compiled
+# into one alternation, so routing a transcript is a single regex match no
+# matter how many skills are registered.
+#
+# Run "python intents.py --bench [transcripts.txt]" to time the router alone.
+
+import argparse
+import re
+import time
+
+# --- Cost Classes ---
+LOCAL = "local"   # Answered on the Brain from local state (DB snapshot, sensors)
+LLM = "llm"       # Needs the local language model
+CLOUD = "cloud"   # Needs the OpenAI API
+
+NUMBER_WORDS = {"a": 1, "an": 1, "one": 1, "two": 2, "three": 3, "four": 4, "five": 5,
+                "six": 6, "seven": 7, "eight": 8, "nine": 9, "ten": 10}
+NUMBER = r"\d+|" + "|".join(sorted(NUMBER_WORDS, key=len, reverse=True))
+
+def parse_quantity(word):
+    if word is None:
+        return 1
+    return NUMBER_WORDS.get(word, int(word) if word.isdigit() else 1)
+
+# Slot values are converted by these before they reach the skill.
+SLOT_PARSERS = {
+    "quantity": parse_quantity,
+    "item": lambda value: " ".join(value.split()) if value else value,
+}
+
+class Skill:
+    """
+    A skill's routing declaration. patterns are matched against the lowercased
+    transcript (anywhere in it); named groups become keyword arguments of the
+    skill. phrases are sample fragments used to build the ASR command grammar.
+    """
+
+    def __init__(self, name, cost, patterns, phrases=()):
+        self.name = name
+        self.cost = cost
+        self.patterns = patterns
+        self.phrases = list(phrases)
+
+    def __repr__(self):
+        return f"Skill({self.name!r}, {self.cost!r})"
+
+class Intent:
+    def __init__(self, skill, slots):
+        self.skill = skill
+        self.slots = slots
+
+    @property
+    def name(self):
+        return self.skill.name
+
+    @property
+    def cost(self):
+        return self.skill.cost
+
+# --- Skill Declarations ---
+# Earlier skills win when more than one pattern matches.
+SKILLS = [
+    Skill("add_inventory", LOCAL, [
+        rf"\badd (?:(?P<quantity>{NUMBER}) )?(?P<item>.+?) to (?:the |my )?inventory\b",
+        r"\badd\b.*\binventory\b",  # Malformed add: the skill explains the expected format
+    ], phrases=["add", "to the inventory", "to inventory"]),
+    Skill("inventory_query", LOCAL, [
+        r"\binventory for (?P<item>.+)",
+        r"\binventory\b",
+    ], phrases=["what is the inventory", "what's in the inventory", "show me the inventory",
+                "inventory for", "check the inventory for", "how many", "in the inventory"]),
+    Skill("cpu_temperature", LOCAL, [
+        r"\btemperature\b",
+    ], phrases=["what is the temperature", "what's the cpu temperature", "temperature"]),
+    Skill("local_chat", LLM, [
+        r"\bwho are you\b",
+        r"\bwhat can you do\b",
+    ], phrases=["who are you", "what can you do"]),
+]
+FALLBACK = Skill("cloud_query", CLOUD, [])
+
+class IntentRouter:
+    """Compiles a list of skills into one matcher and routes transcripts to them."""
+
+    def __init__(self, skills=SKILLS, fallback=FALLBACK):
+        self.skills = list(skills)
+        self.fallback = fallback
+        self.compile()
+
+    def compile(self):
+        # Every pattern becomes a named alternative "p<n>"; its slots are renamed
+        # "p<n>_<slot>" so names stay unique. The leading ".*?" anchors every
+        # alternative at the start, which makes declaration order the priority.
+        alternatives = []
+        self.routes = {}
+        for skill in self.skills:
+            for pattern in skill.patterns:
+                key = f"p{len(self.routes)}"
+                slots = re.findall(r"\(\?P<(\w+)>", pattern)
+                renamed = re.sub(r"\(\?P<(\w+)>", lambda m: f"(?P<{key}_{m.group(1)}>", pattern)
+                alternatives.append(f"(?P<{key}>.*?{renamed})")
+                self.routes[key] = (skill, [(f"{key}_{slot}", slot) for slot in slots])
+        self.matcher = re.compile("|".join(alternatives), re.DOTALL) if alternatives else None
+
+    def register(self, skill):
+        """Adds a skill after the existing ones and recompiles the matcher."""
+        self.skills.append(skill)
+        self.compile()
+
+    def route(self, transcript):
+        text = " ".join(transcript.lower().split())
+        match = self.matcher.match(text) if self.matcher else None
+        if not match:
+            return Intent(self.fallback, {})
+        skill, slots = self.routes[match.lastgroup]
+        values = {}
+        for group, slot in slots:
+            value = match.group(group)
+            parser = SLOT_PARSERS.get(slot)
+            values[slot] = parser(value) if parser else value
+        return Intent(skill, values)
+
+    def phrases(self):
+        """Every sample phrase declared by the registered skills."""
+        return [phrase for skill in self.skills for phrase in skill.phrases]
+
+# --- Benchmark ---
+BENCH_TRANSCRIPTS = [
+    "add five resistors to the inventory",
+    "add a soldering iron to inventory",
+    "what is the inventory for capacitors",
+    "what's in the inventory",
+    "what is the cpu temperature",
+    "who are you",
+    "what is the capital of france",
+    "tell me a joke about robots",
+    "",
+]
+
+def bench(transcripts, iterations):
+    router = IntentRouter()
+    for text in transcripts:
+        intent = router.route(text)
+        print(f"{text!r:45} -> {intent.name} ({intent.cost}) {intent.slots}")
+
+    start_time = time.perf_counter()
+    for _ in range(iterations):
+        for text in transcripts:
+            router.route(text)
+    elapsed = time.perf_counter() - start_time
+    calls = iterations * len(transcripts)
+    print(f"\n{calls} routes in {elapsed:.3f}s ({elapsed / calls * 1e6:.1f} us per transcript).")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Intent router utilities.")
+    parser.add_argument("--bench", action="store_true", help="Time the router on sample transcripts.")
+    parser.add_argument("transcripts", nargs="?", help="File with one transcript per line (default: built-in samples).")
+    parser.add_argument("--iterations", type=int, default=10000)
+    args = parser.parse_args()
+    if args.bench:
+        if args.transcripts:
+            with open(args.transcripts, encoding="utf-8") as f:
+                samples = [line.strip() for line in f]
+        else:
+            samples = BENCH_TRANSCRIPTS
+        bench(samples, args.iterations)
+    else:
+        parser.print_help()
@@ -0,0 +1,127 @@
+# Filename: brain_jetson/inventory_cache.py
+# Local snapshot of lab_inventory so inventory questions are answered from
+# memory. Items are indexed by character trigrams, which lets a name that
+# Vosk mangled ("resist her" for "resistor") still find the right row.
+
+import threading
+import time
+from collections import defaultdict
+
+FUZZY_THRESHOLD = 0.35   # Minimum trigram similarity for a fuzzy match
+MAX_FUZZY_MATCHES = 3
+
+def normalize(name):
+    return " ".join(name.lower().split())
+
+def trigrams(text):
+    """Character trigrams of each word, padded so short words still produce some."""
+    grams = set()
+    for word in text.split():
+        padded = f"  {word} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+class InventoryIndex:
+    """
+    Holds {item: quantity} for the whole table plus a trigram -> items index.
+    Reads never touch the database. Writes go to the database first and are
+    then applied here (write-through), and a background refresh picks up
+    edits made outside the assistant.
+    """
+
+    def __init__(self, db, refresh_interval=60):
+        self.db = db
+        self.refresh_interval = refresh_interval
+        self.items = {}
+        self.index = defaultdict(set)
+        self.grams = {}
+        self.ready = False
+        self.lock = threading.Lock()
+        self.listeners = []
+
+    def add_listener(self, callback):
+        """Registers callback(item_names), called whenever the set of items changes."""
+        self.listeners.append(callback)
+
+    def _notify(self, names):
+        for callback in self.listeners:
+            try:
+                callback(names)
+            except Exception as e:
+                print(f"Inventory change listener failed: {e}")
+
+    def refresh(self):
+        """Reloads the snapshot from the database and rebuilds the index."""
+        rows = self.db.fetch_all()
+        items = {}
+        for item, quantity in rows:
+            items[normalize(item)] = quantity
+        index = defaultdict(set)
+        grams = {}
+        for item in items:
+            grams[item] = trigrams(item)
+            for gram in grams[item]:
+                index[gram].add(item)
+        with self.lock:
+            changed = set(items) != set(self.items)
+            self.items, self.index, self.grams = items, index, grams
+            self.ready = True
+        if changed:
+            self._notify(list(items))
+
+    def start_refresh(self):
+        def loop():
+            while True:
+                time.sleep(self.refresh_interval)
+                try:
+                    self.refresh()
+                except Exception as e:
+                    print(f"Inventory refresh failed, keeping the old snapshot: {e}")
+        threading.Thread(target=loop, name="inventory-refresh", daemon=True).start()
+
+    def apply_add(self, item, quantity):
+        """Mirrors a successful UPSERT into the snapshot."""
+        item = normalize(item)
+        with self.lock:
+            is_new = item not in self.items
+            if is_new:
+                self.items[item] = 0
+                self.grams[item] = trigrams(item)
+                for gram in self.grams[item]:
+                    self.index[gram].add(item)
+            self.items[item] += quantity
+            names = list(self.items)
+        if is_new:
+            self._notify(names)
+
+    def all(self):
+        with self.lock:
+            return sorted(self.items.items())
+
+    def lookup(self, name):
+        """
+        Returns [(item, quantity)] for a spoken item name: an exact match, else
+        every item containing the name (like the old LIKE query), else the
+        closest items by trigram similarity.
+        """
+        name = normalize(name)
+        with self.lock:
+            if name in self.items:
+                return [(name, self.items[name])]
+
+            contains = [(item, qty) for item, qty in self.items.items() if name in item]
+            if contains:
+                return sorted(contains)
+
+            query_grams = trigrams(name)
+            candidates = set()
+            for gram in query_grams:
+                candidates |= self.index.get(gram, set())
+            scored = []
+            for item in candidates:
+                item_grams = self.grams[item]
+                score = len(query_grams & item_grams) / len(query_grams | item_grams)
+                if score >= FUZZY_THRESHOLD:
+                    scored.append((score, item))
+            scored.sort(reverse=True)
+            return [(item, self.items[item]) for _, item in scored[:MAX_FUZZY_MATCHES]]
@@ -0,0 +1,134 @@
+# Filename: brain_jetson/inventory_db.py
+# Thread-safe data access for the inventory skills. Connections come from a
+# pool, are health-checked (and reconnected) before use, and every query runs
+# as a server-side prepared statement that is reused for the life of the
+# connection.
+
+import threading
+import time
+from contextlib import contextmanager
+
+from mysql.connector import errors, pooling
+
+from metrics import REGISTRY
+
+# --- Statements ---
+SELECT_ALL = "SELECT item, quantity FROM lab_inventory"
+SELECT_LIKE = "SELECT item, quantity FROM lab_inventory WHERE item LIKE %s"
+UPSERT = """
+    INSERT INTO lab_inventory (item, quantity)
+    VALUES (%s, %s)
+    ON DUPLICATE KEY UPDATE quantity = quantity + VALUES(quantity)
+"""
+
+# Errors that mean the connection (not the query) is bad and a retry may help
+RETRYABLE_ERRORS = (errors.OperationalError, errors.InterfaceError)
+
+query_count = REGISTRY.counter("brain_db_queries_total", "Inventory queries executed, by statement.")
+query_seconds = REGISTRY.counter("brain_db_query_seconds_total", "Time spent in inventory queries, by statement.")
+query_errors = REGISTRY.counter("brain_db_query_errors_total", "Inventory queries that failed, by statement.")
+
+def _text(value):
+    # Prepared-statement results can come back as bytearray depending on the connector version.
+    return value.decode('utf-8') if isinstance(value, (bytes, bytearray)) else value
+
+class InventoryDB:
+    """Pooled access to the lab_inventory table, safe to share between threads."""
+
+    def __init__(self, host, user, password, database, pool_size=5, retries=2):
+        self.pool_size = pool_size
+        self.retries = retries
+        self.pool = pooling.MySQLConnectionPool(
+            pool_name="inventory", pool_size=pool_size,
+            # Session reset would deallocate the prepared statements we keep per connection.
+            pool_reset_session=False,
+            host=host, user=user, password=password, database=database,
+            # Every statement is its own transaction, so reads never see a stale snapshot.
+            autocommit=True,
+        )
+        # The pool raises instead of waiting when it's empty; make callers wait instead.
+        self.slots = threading.BoundedSemaphore(pool_size)
+        self.timings = {}
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def connection(self):
+        """Checks a connection out of the pool, making sure it is alive first."""
+        with self.slots:
+            conn = self.pool.get_connection()
+            try:
+                conn.ping(reconnect=True, attempts=3, delay=0.5)
+                yield conn
+            finally:
+                conn.close()  # Returns it to the pool
+
+    @staticmethod
+    def _prepared(conn):
+        # The pool hands out a new wrapper on every checkout, so the cursors are
+        # kept on the pooled connection underneath it and go away with it. Only
+        # the thread that checked the connection out touches them.
+        return getattr(conn, '_cnx', conn)
+
+    def _cursor(self, conn, query):
+        # A prepared cursor re-executes the same statement without preparing it again.
+        # connection_id changes after a reconnect, which discards the stale statements.
+        cnx = self._prepared(conn)
+        cached = getattr(cnx, 'prepared_cursors', None)
+        if cached is None or cached[0] != conn.connection_id:
+            cached = cnx.prepared_cursors = (conn.connection_id, {})
+        cursors = cached[1]
+        cursor = cursors.get(query)
+        if cursor is None:
+            cursor = cursors[query] = conn.cursor(prepared=True)
+        return cursor
+
+    def _forget_cursors(self, conn):
+        self._prepared(conn).prepared_cursors = None
+
+    def execute(self, name, query, params=(), fetch=True):
+        """Runs a statement with retries on connection errors. Returns rows or the row count."""
+        for attempt in range(self.retries + 1):
+            start_time = time.monotonic()
+            try:
+                with self.connection() as conn:
+                    cursor = self._cursor(conn, query)
+                    try:
+                        cursor.execute(query, params)
+                        result = cursor.fetchall() if fetch else cursor.rowcount
+                    except RETRYABLE_ERRORS:
+                        self._forget_cursors(conn)
+                        raise
+                self._record(name, time.monotonic() - start_time)
+                return result
+            except RETRYABLE_ERRORS as e:
+                query_errors.inc(query=name)
+                if attempt == self.retries:
+                    raise
+                print(f"Database connection problem on '{name}' ({e}), retrying...")
+                time.sleep(0.2 * (attempt + 1))
+            except errors.Error:
+                query_errors.inc(query=name)
+                raise
+
+    def _record(self, name, seconds):
+        query_count.inc(query=name)
+        query_seconds.inc(seconds, query=name)
+        with self.lock:
+            count, total, worst = self.timings.get(name, (0, 0.0, 0.0))
+            self.timings[name] = (count + 1, total + seconds, max(worst, seconds))
+
+    def timing_summary(self):
+        """Returns {statement: (count, mean seconds, max seconds)}."""
+        with self.lock:
+            return {name: (count, total / count, worst) for name, (count, total, worst) in self.timings.items()}
+
+    # --- Inventory operations ---
+    def fetch_all(self):
+        return [(_text(item), quantity) for item, quantity in self.execute("select_all", SELECT_ALL)]
+
+    def find(self, item_name):
+        rows = self.execute("select_like", SELECT_LIKE, (f"%{item_name}%",))
+        return [(_text(item), quantity) for item, quantity in rows]
+
+    def add(self, item_name, quantity):
+        return self.execute("upsert", UPSERT, (item_name, quantity), fetch=False)
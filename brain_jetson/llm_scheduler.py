@@ -0,0 +1,216 @@
+# Filename: brain_jetson/llm_scheduler.py
+# Chooses which language model answers a question. Each backend keeps a
+# rolling record of how long it takes to start answering and how often it
+# fails; a question goes to the backend expected to answer first for its
+# class, and if that backend is slower than usual (past its own p90) the
+# same question is sent to the other one. Whichever starts streaming first
+# is used and the other is cancelled.
+
+import queue
+import threading
+import time
+from collections import deque
+
+from metrics import REGISTRY
+
+hedged_requests = REGISTRY.counter("brain_llm_hedged_requests_total", "LLM requests that were also sent to a second backend.")
+backend_wins = REGISTRY.counter("brain_llm_answers_total", "LLM answers, by the backend that produced them.")
+backend_errors = REGISTRY.counter("brain_llm_errors_total", "Failed LLM requests, by backend.")
+latency_p50 = REGISTRY.gauge("brain_llm_latency_p50_seconds", "Rolling median time to first token, by backend.")
+latency_p90 = REGISTRY.gauge("brain_llm_latency_p90_seconds", "Rolling p90 time to first token, by backend.")
+error_rates = REGISTRY.gauge("brain_llm_error_rate", "Rolling share of failed requests, by backend.")
+
+_DONE = object()
+
+class NoBackendAvailable(Exception):
+    """Every backend tried for a question failed."""
+
+class Backend:
+    """
+    One language model. stream(messages) returns an iterator of text pieces.
+    Latency is the time from sending the request to the first piece. If
+    admit() and release() are given they bound concurrent requests (e.g. an
+    admission control slot); a backend that can't be admitted is skipped.
+    """
+
+    def __init__(self, name, stream, default_latency=2.0, window=50, admit=None, release=None):
+        self.name = name
+        self.stream = stream
+        self.admit = admit
+        self.release = release
+        self.default_latency = default_latency  # Assumed until there are samples
+        self.latencies = deque(maxlen=window)
+        self.outcomes = deque(maxlen=window)   # True for success, False for failure
+        self.lock = threading.Lock()
+
+    def record(self, latency=None, ok=True):
+        with self.lock:
+            if latency is not None:
+                self.latencies.append(latency)
+            self.outcomes.append(ok)
+        if not ok:
+            backend_errors.inc(backend=self.name)
+
+    def percentile(self, q):
+        with self.lock:
+            samples = sorted(self.latencies)
+        if not samples:
+            return self.default_latency
+        return samples[min(len(samples) - 1, int(q * len(samples)))]
+
+    def error_rate(self):
+        with self.lock:
+            if not self.outcomes:
+                return 0.0
+            return self.outcomes.count(False) / len(self.outcomes)
+
+    def expected_latency(self):
+        # A backend that fails half the time is, on average, worth half as much.
+        return self.percentile(0.5) / max(1.0 - self.error_rate(), 0.1)
+
+class LLMScheduler:
+    """
+    Routes questions between backends. preferences maps a query class to the
+    backend favoured for it; the other backends are only chosen first when
+    their expected latency beats the favourite's by more than preference_factor.
+    """
+
+    def __init__(self, backends, preferences, preference_factor=2.0,
+                 min_hedge_delay=0.5, max_hedge_delay=8.0, hedging=True):
+        self.backends = {backend.name: backend for backend in backends}
+        self.preferences = preferences
+        self.preference_factor = preference_factor
+        self.min_hedge_delay = min_hedge_delay
+        self.max_hedge_delay = max_hedge_delay
+        self.hedging = hedging
+        for backend in backends:
+            latency_p50.set_function(lambda b=backend: b.percentile(0.5), backend=backend.name)
+            latency_p90.set_function(lambda b=backend: b.percentile(0.9), backend=backend.name)
+            error_rates.set_function(backend.error_rate, backend=backend.name)
+
+    def order(self, query_class):
+        """Backends for a query class, the one to try first at the front."""
+        preferred = self.preferences.get(query_class)
+
+        def score(backend):
+            factor = 1.0 if backend.name == preferred else self.preference_factor
+            return backend.expected_latency() * factor
+
+        return sorted(self.backends.values(), key=score)
+
+    def hedge_delay(self, backend):
+        return min(max(backend.percentile(0.9), self.min_hedge_delay), self.max_hedge_delay)
+
+    def _run(self, backend, messages, out, cancel, release=None):
+        start_time = time.monotonic()
+        first = True
+        pieces = None
+        try:
+            pieces = iter(backend.stream(messages))
+            for piece in pieces:
+                if cancel.is_set():
+                    # The other backend won; count the time spent as a lower bound on our latency.
+                    if first:
+                        backend.record(time.monotonic() - start_time)
+                    return
+                if first:
+                    backend.record(time.monotonic() - start_time)
+                    first = False
+                out.put((backend, piece))
+            if first:
+                backend.record(ok=False)  # An empty answer is as good as a failure
+            out.put((backend, _DONE))
+        except Exception as e:
+            if not cancel.is_set():
+                backend.record(ok=False)
+                print(f"LLM backend '{backend.name}' failed: {e}")
+            out.put((backend, e))
+        finally:
+            close = getattr(pieces, 'close', None)
+            if close:
+                close()
+            if release:
+                release()
+
+    def ask(self, query_class, messages, reserved=()):
+        """
+        Streams the answer to messages (an OpenAI/Ollama style chat list) from
+        whichever backend starts answering first. reserved names backends the
+        caller already holds a slot for, so they are used without admit().
+        Raises NoBackendAvailable if every backend fails before producing
+        anything, or none can be admitted.
+        """
+        candidates = self.order(query_class)
+        out = queue.Queue()
+        cancels = {}
+        skipped = set()  # Backends that had no free slot
+        failed = set()
+        winner = None
+
+        def launch(backend):
+            release = None
+            if backend.name not in reserved and backend.admit:
+                if not backend.admit():
+                    skipped.add(backend.name)
+                    return False
+                release = backend.release
+            cancels[backend.name] = threading.Event()
+            threading.Thread(target=self._run, args=(backend, messages, out, cancels[backend.name], release),
+                             name=f"llm-{backend.name}", daemon=True).start()
+            return True
+
+        def next_candidate():
+            for backend in candidates:
+                if backend.name not in cancels and backend.name not in skipped:
+                    return backend
+            return None
+
+        def launch_next():
+            """Starts the next candidate that can be admitted. Returns it, or None."""
+            while True:
+                backend = next_candidate()
+                if backend is None or launch(backend):
+                    return backend
+
+        first = launch_next()
+        if first is None:
+            raise NoBackendAvailable(f"No LLM backend is free for a {query_class} question.")
+        deadline = time.monotonic() + self.hedge_delay(first)
+        try:
+            while True:
+                timeout = None
+                if winner is None and self.hedging and next_candidate():
+                    timeout = max(deadline - time.monotonic(), 0)
+                try:
+                    backend, item = out.get(timeout=timeout)
+                except queue.Empty:
+                    backup = launch_next()
+                    if backup:
+                        print(f"No answer from '{first.name}' after its p90, also asking '{backup.name}'.")
+                        hedged_requests.inc()
+                        deadline = time.monotonic() + self.hedge_delay(backup)
+                    continue
+
+                if winner is None:
+                    if item is _DONE or isinstance(item, Exception):
+                        failed.add(backend.name)
+                        # Fail over right away instead of waiting for the hedge.
+                        if not launch_next() and len(failed) == len(cancels):
+                            raise NoBackendAvailable(f"All LLM backends failed for a {query_class} question.")
+                        continue
+                    winner = backend
+                    backend_wins.inc(backend=backend.name)
+                    for name, cancel in cancels.items():
+                        if name != backend.name:
+                            cancel.set()
+
+                if backend is not winner:
+                    continue
+                if item is _DONE:
+                    return
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            for cancel in cancels.values():
+                cancel.set()
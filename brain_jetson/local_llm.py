@@ -0,0 +1,101 @@
+# Filename: brain_jetson/local_llm.py
+# Manages the model served by the local Ollama instance. The model is loaded
+# at startup and pinned in memory with keep_alive, and every request is sent
+# with the same options and the same leading system prompt. Ollama reuses the
+# KV cache for the longest matching prompt prefix, so with a stable prefix a
+# follow-up turn only evaluates the tokens added since the previous one.
+
+import threading
+import time
+
+import ollama
+
+from metrics import REGISTRY
+
+SYSTEM_PROMPT = ("You are the lab's voice assistant. Answers are spoken aloud, so keep them "
+                 "short, plain and free of markdown, lists or code.")
+
+load_seconds = REGISTRY.counter("brain_local_llm_load_seconds_total", "Time Ollama spent loading the local model.")
+prompt_seconds = REGISTRY.counter("brain_local_llm_prompt_eval_seconds_total", "Time spent evaluating prompts on the local model.")
+prompt_tokens = REGISTRY.counter("brain_local_llm_prompt_tokens_total", "Prompt tokens evaluated (not served from the KV cache).")
+eval_seconds = REGISTRY.counter("brain_local_llm_eval_seconds_total", "Time spent generating tokens on the local model.")
+eval_tokens = REGISTRY.counter("brain_local_llm_eval_tokens_total", "Tokens generated by the local model.")
+
+def _seconds(nanoseconds):
+    return (nanoseconds or 0) / 1e9
+
+class LocalLLM:
+    """
+    Streams chat answers from one Ollama model. keep_alive is passed on every
+    call (-1 keeps the model loaded indefinitely). options must stay the same
+    between calls: a different num_ctx, for example, makes Ollama reload the model.
+    """
+
+    def __init__(self, model, keep_alive=-1, options=None, system_prompt=SYSTEM_PROMPT, host=None):
+        self.model = model
+        self.keep_alive = keep_alive
+        self.options = options or {}
+        self.system_prompt = system_prompt
+        self.client = ollama.Client(host=host) if host else ollama.Client()
+
+    def _messages(self, messages):
+        # The fixed system prompt always comes first so every request shares that prefix.
+        return [{"role": "system", "content": self.system_prompt}] + list(messages)
+
+    def warm_up(self):
+        """Loads the model and evaluates the system prompt so the first question starts warm."""
+        start_time = time.monotonic()
+        response = self.client.chat(model=self.model, messages=self._messages([]), stream=False,
+                                    keep_alive=self.keep_alive, options=dict(self.options, num_predict=1))
+        self._report(response, "warm-up")
+        print(f"Local model '{self.model}' loaded and warmed up in {time.monotonic() - start_time:.2f}s.")
+
+    def is_loaded(self):
+        try:
+            running = self.client.ps().get('models', [])
+        except Exception as e:
+            print(f"Could not ask Ollama which models are loaded: {e}")
+            return True  # Don't reload blindly when Ollama can't be reached
+        return any(m.get('model') == self.model or m.get('name') == self.model for m in running)
+
+    def start_keep_resident(self, interval=300):
+        """Reloads the model if Ollama unloaded it anyway (e.g. after an Ollama restart)."""
+        def loop():
+            while True:
+                time.sleep(interval)
+                if not self.is_loaded():
+                    print(f"Local model '{self.model}' is no longer loaded, reloading...")
+                    try:
+                        self.warm_up()
+                    except Exception as e:
+                        print(f"Could not reload the local model: {e}")
+        threading.Thread(target=loop, name="local-llm-keepalive", daemon=True).start()
+
+    def stream(self, messages):
+        """Yields the answer to a chat message list piece by piece."""
+        stream = self.client.chat(model=self.model, messages=self._messages(messages), stream=True,
+                                  keep_alive=self.keep_alive, options=self.options)
+        for chunk in stream:
+            piece = chunk['message']['content']
+            if piece:
+                yield piece
+            if chunk.get('done'):
+                self._report(chunk, "chat")
+
+    def _report(self, response, label):
+        timings = {
+            "load": _seconds(response.get('load_duration')),
+            "prompt_eval": _seconds(response.get('prompt_eval_duration')),
+            "prompt_tokens": response.get('prompt_eval_count') or 0,
+            "eval": _seconds(response.get('eval_duration')),
+            "eval_tokens": response.get('eval_count') or 0,
+        }
+        load_seconds.inc(timings["load"])
+        prompt_seconds.inc(timings["prompt_eval"])
+        prompt_tokens.inc(timings["prompt_tokens"])
+        eval_seconds.inc(timings["eval"])
+        eval_tokens.inc(timings["eval_tokens"])
+        rate = timings["eval_tokens"] / timings["eval"] if timings["eval"] else 0.0
+        print(f"Local LLM {label}: load {timings['load'] * 1000:.0f} ms, "
+              f"prompt {timings['prompt_tokens']} tokens in {timings['prompt_eval'] * 1000:.0f} ms, "
+              f"generated {timings['eval_tokens']} tokens in {timings['eval'] * 1000:.0f} ms ({rate:.1f} tok/s)")
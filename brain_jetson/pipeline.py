@@ -0,0 +1,317 @@
+# Filename: brain_jetson/pipeline.py
+# Staged request pipeline for the Brain. A gRPC handler only does ASR and
+# hands the transcript off; intent routing, response generation and speech
+# synthesis each run on their own worker threads, connected by bounded
+# queues, and all local audio goes through one serialized player.
+
+import itertools
+import queue
+import threading
+import traceback
+from collections import deque
+
+import numpy as np
+import sounddevice as sd
+
+from admission import DEFAULT_PRIORITY
+from tracing import Trace
+
+class Utterance:
+    """
+    A piece of audio on its way to a speaker or an ACU. PCM chunks are put in
+    by the producer (TTS or a preloaded sound) and read out by iterating, as
+    (sample_rate, pcm, text) tuples. Each chunk carries its own rate, since
+    sentences may come from different sources; text is the sentence a chunk
+    starts, or None.
+    """
+
+    def __init__(self, sample_rate=None, pcm=None, acu_id=None):
+        self.sample_rate = sample_rate  # Default rate for chunks put without one
+        self.acu_id = acu_id  # ACU whose command this answers; scopes barge-in on the Player
+        self.chunks = queue.Queue()
+        self.played = threading.Event()
+        self.on_start = None  # Called by the player just before the first chunk is played
+        self.cancelled = False
+        if pcm is not None:
+            self.put(pcm)
+            self.close()
+
+    def put(self, pcm, sample_rate=None, text=None):
+        if not self.cancelled:
+            self.chunks.put((sample_rate or self.sample_rate, pcm, text))
+
+    def close(self):
+        """Marks the end of the audio. Safe to call more than once."""
+        self.chunks.put(None)
+
+    def cancel(self):
+        """Abandons the audio: what is buffered is dropped and further put()s are ignored."""
+        self.cancelled = True
+        while True:
+            try:
+                self.chunks.get_nowait()
+            except queue.Empty:
+                break
+        self.close()
+
+    def __iter__(self):
+        while True:
+            chunk = self.chunks.get()
+            if chunk is None:
+                return
+            yield chunk
+
+class Job:
+    """One command travelling through the pipeline."""
+
+    def __init__(self, transcript, play_locally=True, acu_id=None, trace=None):
+        self.transcript = transcript
+        self.trace = trace or Trace()     # Stage timings, keyed to the ACU's request id
+        self.acu_id = acu_id              # Which ACU asked; selects the conversation session
+        self.play_locally = play_locally  # False when the ACU plays the reply (Converse)
+        self.skill = None                 # Zero-argument callable chosen by the intent stage
+        self.cost = None                  # The skill's cost class (intents.LOCAL, LLM or CLOUD)
+        self.priority = DEFAULT_PRIORITY  # Lower is served first by the stage queues
+        self.sentences = queue.Queue()    # Reply sentences from the generation stage, then None
+        self.response = None              # Full reply text, once generation is complete
+        self.utterance = Utterance(acu_id=acu_id)  # Filled by the synthesis stage
+        self.stage = None                 # Stage currently responsible for the job
+        self.error = None
+        self.cancelled = False            # Set by cancel(); the stages stop working on the job
+        self.done_callbacks = []
+        self.done = False
+        self.lock = threading.Lock()
+
+    def on_done(self, callback):
+        """Registers callback(job), run once when the job has finished or failed."""
+        self.done_callbacks.append(callback)
+
+    def finish(self):
+        with self.lock:
+            if self.done:
+                return
+            self.done = True
+        for callback in self.done_callbacks:
+            try:
+                callback(self)
+            except Exception as e:
+                print(f"Job completion callback failed: {e}")
+
+    def forward(self):
+        """
+        Hands the job to the next stage right away, while the current handler
+        keeps working on it (e.g. generation still streaming sentences).
+        """
+        self.stage.forward(self)
+
+    def cancel(self):
+        """Drops the reply (barge-in). Generation and synthesis give up at their next step."""
+        self.cancelled = True
+        self.utterance.cancel()
+
+    def fail(self, error):
+        self.error = error
+        self.sentences.put(None)
+        self.utterance.close()
+        self.finish()
+
+class Stage:
+    """
+    A pool of worker threads reading jobs from a bounded queue. After the
+    handler runs, the job is passed on to the next stage; a full downstream
+    queue blocks the worker, which in turn fills this stage's queue.
+    Waiting jobs are taken by priority, then in arrival order.
+    """
+
+    def __init__(self, name, handler, workers=1, maxsize=8, next_stage=None):
+        self.name = name
+        self.handler = handler
+        self.next_stage = next_stage
+        self.queue = queue.PriorityQueue(maxsize=maxsize)
+        self.order = itertools.count()
+        self.busy = 0
+        self.lock = threading.Lock()
+        for i in range(workers):
+            threading.Thread(target=self._run, name=f"{name}-{i}", daemon=True).start()
+
+    def put(self, job, timeout=None):
+        """Queues a job. Raises queue.Full if the stage stays full past the timeout."""
+        self.queue.put((job.priority, next(self.order), job), timeout=timeout)
+
+    def depth(self):
+        return self.queue.qsize()
+
+    def busy_workers(self):
+        return self.busy
+
+    def forward(self, job):
+        # A job is only passed on once, whether the handler forwarded it early or not.
+        if job.stage is self and self.next_stage:
+            job.stage = self.next_stage
+            self.next_stage.put(job)
+
+    def _run(self):
+        while True:
+            _, _, job = self.queue.get()
+            if job.cancelled:
+                job.sentences.put(None)
+                job.finish()
+                continue
+            job.stage = self
+            with self.lock:
+                self.busy += 1
+            try:
+                self.handler(job)
+            except Exception as e:
+                print(f"Error in the {self.name} stage: {e}")
+                traceback.print_exc()
+                job.fail(e)
+            finally:
+                with self.lock:
+                    self.busy -= 1
+            if job.cancelled:
+                if job.stage is self:
+                    # Cancelled while the handler ran and not handed on, so no
+                    # later stage will finish it; release what it holds here.
+                    job.sentences.put(None)
+                    job.finish()
+            elif job.error is None:
+                self.forward(job)
+
+class Player:
+    """
+    The Brain's speaker. One output stream is opened at startup and stays
+    open; PortAudio's callback pulls PCM from the queued utterances back to
+    back, so consecutive utterances play without a gap and no reply waits
+    for the device to open. Utterances play one at a time in the order they
+    were queued, so overlapping requests from several ACUs take turns.
+    interrupt(acu_id) stops and drops that ACU's utterances only.
+    """
+
+    def __init__(self, sample_rate=24000, blocksize=1024, maxsize=16):
+        self.sample_rate = sample_rate
+        self.queue = queue.Queue(maxsize=maxsize)  # (generation, utterance) waiting to be fed
+        self.segments = deque()   # [utterance, pcm, offset] ready for the callback; pcm None ends an utterance
+        self.current = None       # Utterance the callback is playing
+        self.feeding = None       # Utterance the feeder is reading from
+        self.generations = {}     # acu_id -> count bumped by interrupt(); older utterances are dropped
+        self.underruns = 0        # Callbacks that ran dry in the middle of an utterance
+        self.notices = queue.SimpleQueue()
+        self.lock = threading.Lock()
+        try:
+            self.stream = sd.RawOutputStream(samplerate=sample_rate, channels=1, dtype='int16',
+                                             blocksize=blocksize, callback=self._callback)
+            self.stream.start()
+        except Exception as e:
+            print(f"Could not open the audio output, local playback is disabled: {e}")
+            self.stream = None
+        threading.Thread(target=self._run, name="player", daemon=True).start()
+        threading.Thread(target=self._notify, name="player-events", daemon=True).start()
+
+    @property
+    def playing(self):
+        return self.current is not None or bool(self.segments)
+
+    def play(self, utterance):
+        self.queue.put((self._generation(utterance), utterance))
+        return utterance
+
+    def _generation(self, utterance):
+        return self.generations.get(utterance.acu_id, 0)
+
+    def depth(self):
+        return self.queue.qsize()
+
+    def interrupt(self, acu_id):
+        """
+        Barge-in at one ACU: silences its utterance at once and drops its
+        queued ones. Replies to other ACUs keep their place and play on.
+        """
+        with self.lock:
+            self.generations[acu_id] = self.generations.get(acu_id, 0) + 1
+            dropped = {segment[0] for segment in self.segments if segment[0].acu_id == acu_id}
+            dropped.update(u for u in (self.current, self.feeding) if u is not None and u.acu_id == acu_id)
+            kept = [segment for segment in self.segments if segment[0].acu_id != acu_id]
+            self.segments.clear()
+            self.segments.extend(kept)
+            if self.current in dropped:
+                self.current = None
+        for utterance in dropped:
+            utterance.cancel()  # Also unblocks the feeder if it is waiting on this one
+            utterance.played.set()
+
+    # --- Feeder thread: utterances -> segments ---
+    def _run(self):
+        while True:
+            generation, utterance = self.queue.get()
+            with self.lock:
+                stale = generation != self._generation(utterance)
+                self.feeding = None if stale else utterance
+            if stale or utterance.cancelled or self.stream is None:
+                utterance.played.set()
+                continue
+            try:
+                for sample_rate, pcm, _ in utterance:
+                    pcm = resample(pcm, sample_rate, self.sample_rate)
+                    with self.lock:
+                        if generation != self._generation(utterance):
+                            break
+                        self.segments.append([utterance, pcm, 0])
+                with self.lock:
+                    self.feeding = None
+                    if generation == self._generation(utterance):
+                        self.segments.append([utterance, None, 0])
+                        continue
+            except Exception as e:
+                print(f"Error during playback: {e}")
+                traceback.print_exc()
+            self.feeding = None
+            utterance.played.set()
+
+    # --- PortAudio thread: segments -> speaker ---
+    def _callback(self, outdata, frames, time_info, status):
+        needed = len(outdata)
+        filled = 0
+        with self.lock:
+            while filled < needed and self.segments:
+                segment = self.segments[0]
+                utterance, pcm, offset = segment
+                if pcm is None:
+                    self.segments.popleft()
+                    self.current = None
+                    self.notices.put((utterance, "finished"))
+                    continue
+                if utterance is not self.current:
+                    self.current = utterance
+                    self.notices.put((utterance, "started"))
+                take = min(needed - filled, len(pcm) - offset)
+                outdata[filled:filled + take] = pcm[offset:offset + take]
+                filled += take
+                if offset + take == len(pcm):
+                    self.segments.popleft()
+                else:
+                    segment[2] = offset + take
+            if filled < needed and self.current is not None:
+                self.underruns += 1  # TTS hasn't caught up with playback
+        if filled < needed:
+            outdata[filled:] = bytes(needed - filled)
+
+    def _notify(self):
+        # Runs the hooks outside the audio callback, which must never block.
+        while True:
+            utterance, event = self.notices.get()
+            if event == "finished":
+                utterance.played.set()
+            elif utterance.on_start:
+                try:
+                    utterance.on_start()
+                except Exception as e:
+                    print(f"Playback start hook failed: {e}")
+
+def resample(pcm, from_rate, to_rate):
+    """Linear resampling of 16-bit mono PCM; returns pcm unchanged when the rates match."""
+    if not from_rate or from_rate == to_rate:
+        return pcm
+    samples = np.frombuffer(pcm, dtype='<i2')
+    positions = np.arange(0, len(samples), from_rate / to_rate)
+    return np.interp(positions, np.arange(len(samples)), samples).astype('<i2').tobytes()
@@ -0,0 +1,205 @@
+# Filename: brain_jetson/response_cache.py
+# Cache of LLM answers keyed by what was asked. A question is looked up by its
+# normalized text first and then by meaning: every cached question has a
+# sentence embedding, and a new question whose embedding is close enough to a
+# cached one gets that answer without calling OpenAI or the local model.
+
+import json
+import os
+import threading
+import time
+
+import numpy as np
+
+from metrics import REGISTRY
+
+cache_lookups = REGISTRY.counter("brain_response_cache_lookups_total", "LLM response cache lookups, by result.")
+
+def normalize(text):
+    return " ".join(text.lower().split()).strip(" .?!")
+
+class ResponseCache:
+    """
+    Holds up to max_entries answers, each valid for ttl seconds. The embeddings
+    live in one preallocated (max_entries, dim) matrix of unit vectors, so a
+    semantic lookup is a single matrix-vector product. When the cache is full
+    the least recently used entry is replaced. Answers are kept per namespace,
+    the query class ("chat" or "general"), so a question only matches answers
+    given for the same kind of question, whichever backend produced them.
+
+    embed(text) returns a 1-D vector; if it fails, only exact matches are served.
+    """
+
+    def __init__(self, embed, max_entries=512, ttl=24 * 3600, threshold=0.92, path=None):
+        self.embed = embed
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.threshold = threshold
+        self.path = path  # Base path; the index is saved as <path>.npz and <path>.json
+        self.vectors = None
+        self.entries = [None] * max_entries  # slot -> {namespace, question, answer, created, used}
+        self.exact = {}                      # (namespace, normalized question) -> slot
+        self.dirty = False
+        self.lock = threading.Lock()
+        self.load()
+
+    # --- Lookup ---
+    def _embed(self, text):
+        try:
+            vector = np.asarray(self.embed(text), dtype=np.float32)
+        except Exception as e:
+            print(f"Could not embed '{text}' for the response cache: {e}")
+            return None
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else None
+
+    def _alive(self, entry, now):
+        return entry is not None and now - entry["created"] < self.ttl
+
+    def lookup(self, namespace, question):
+        """
+        Returns (answer, how, vector): how is "exact", "semantic" or None on a
+        miss, and vector is the question's embedding (None if it wasn't needed
+        or couldn't be computed) so a following put() doesn't embed it again.
+        """
+        now = time.time()
+        key = (namespace, normalize(question))
+        with self.lock:
+            slot = self.exact.get(key)
+            if slot is not None and self._alive(self.entries[slot], now):
+                self.entries[slot]["used"] = now
+                return self.entries[slot]["answer"], "exact", None
+
+        vector = self._embed(key[1])
+        if vector is None:
+            return None, None, None
+        with self.lock:
+            if self.vectors is None or self.vectors.shape[1] != vector.shape[0]:
+                return None, None, vector
+            scores = self.vectors @ vector
+            for slot, entry in enumerate(self.entries):
+                if not self._alive(entry, now) or entry["namespace"] != namespace:
+                    scores[slot] = -1.0
+            slot = int(np.argmax(scores))
+            if scores[slot] < self.threshold:
+                return None, None, vector
+            entry = self.entries[slot]
+            entry["used"] = now
+            print(f"Response cache: '{question}' matched '{entry['question']}' ({scores[slot]:.3f}).")
+            return entry["answer"], "semantic", vector
+
+    def get(self, namespace, question):
+        return self.lookup(namespace, question)[0]
+
+    # --- Insertion ---
+    def _free_slot(self, now):
+        # An empty or expired slot if there is one, else the least recently used.
+        oldest, oldest_used = 0, None
+        for slot, entry in enumerate(self.entries):
+            if not self._alive(entry, now):
+                return slot
+            if oldest_used is None or entry["used"] < oldest_used:
+                oldest, oldest_used = slot, entry["used"]
+        return oldest
+
+    def put(self, namespace, question, answer, vector=None):
+        if not answer:
+            return
+        now = time.time()
+        key = (namespace, normalize(question))
+        if vector is None:
+            vector = self._embed(key[1])
+        with self.lock:
+            slot = self.exact.get(key)
+            if slot is None:
+                slot = self._free_slot(now)
+            old = self.entries[slot]
+            if old is not None:
+                self.exact.pop((old["namespace"], old["key"]), None)
+            self.entries[slot] = {"namespace": namespace, "key": key[1], "question": question,
+                                  "answer": answer, "created": now, "used": now}
+            self.exact[key] = slot
+            if vector is not None:
+                if self.vectors is None or self.vectors.shape[1] != vector.shape[0]:
+                    # First vector, or the embedding model changed: start a fresh index.
+                    self.vectors = np.zeros((self.max_entries, vector.shape[0]), dtype=np.float32)
+                self.vectors[slot] = vector
+            elif self.vectors is not None:
+                self.vectors[slot] = 0.0  # Reachable by exact match only
+            self.dirty = True
+
+    def through(self, namespace, question, produce):
+        """
+        Yields the cached answer if there is one; otherwise yields from
+        produce() and caches the complete answer once it finishes. An answer
+        cut short by an exception is not cached.
+        """
+        answer, how, vector = self.lookup(namespace, question)
+        if answer is not None:
+            cache_lookups.inc(result=how)
+            yield answer
+            return
+        cache_lookups.inc(result="miss")
+        parts = []
+        for piece in produce():
+            parts.append(piece)
+            yield piece
+        self.put(namespace, question, "".join(parts).strip(), vector)
+
+    # --- Persistence ---
+    def load(self):
+        if not self.path or not os.path.exists(f"{self.path}.json"):
+            return
+        try:
+            with open(f"{self.path}.json", encoding='utf-8') as f:
+                entries = json.load(f)
+            vectors = None
+            if os.path.exists(f"{self.path}.npz"):
+                vectors = np.load(f"{self.path}.npz")["vectors"]
+        except (OSError, ValueError, KeyError) as e:
+            print(f"Could not read the response cache at {self.path}, starting empty: {e}")
+            return
+        now = time.time()
+        live = [(slot, entry) for slot, entry in enumerate(entries)
+                if self._alive(entry, now) and slot < self.max_entries]
+        if vectors is not None and vectors.shape[0] >= len(entries):
+            self.vectors = np.zeros((self.max_entries, vectors.shape[1]), dtype=np.float32)
+        for slot, entry in live:
+            self.entries[slot] = entry
+            self.exact[(entry["namespace"], entry["key"])] = slot
+            if self.vectors is not None:
+                self.vectors[slot] = vectors[slot]
+        print(f"Response cache loaded ({len(live)} answers).")
+
+    def save(self):
+        if not self.path:
+            return
+        with self.lock:
+            if not self.dirty:
+                return
+            entries = list(self.entries)
+            vectors = None if self.vectors is None else self.vectors.copy()
+            self.dirty = False
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        with open(f"{self.path}.json.tmp", "w", encoding='utf-8') as f:
+            json.dump(entries, f)
+        if vectors is not None:
+            with open(f"{self.path}.npz.tmp", "wb") as f:
+                np.savez(f, vectors=vectors)
+            os.replace(f"{self.path}.npz.tmp", f"{self.path}.npz")
+        os.replace(f"{self.path}.json.tmp", f"{self.path}.json")
+
+    def start_autosave(self, interval=60):
+        def loop():
+            while True:
+                time.sleep(interval)
+                try:
+                    self.save()
+                except OSError as e:
+                    print(f"Could not save the response cache: {e}")
+        threading.Thread(target=loop, name="response-cache-save", daemon=True).start()
+
+    def __len__(self):
+        now = time.time()
+        with self.lock:
+            return sum(1 for entry in self.entries if self._alive(entry, now))
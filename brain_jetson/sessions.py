@@ -0,0 +1,115 @@
+# Filename: brain_jetson/sessions.py
+# Conversation history per ACU. Every room gets its own session, so two ACUs
+# talking at once never see each other's turns. A session keeps the recent
+# turns verbatim up to a token budget; older turns are folded into a short
+# extractive summary, which keeps prompts small for the local model.
+
+import threading
+import time
+from collections import deque
+
+from metrics import REGISTRY
+from sentences import split_sentences
+
+active_sessions = REGISTRY.gauge("brain_sessions_active", "Conversation sessions currently held in memory.")
+
+def acu_identity(context):
+    """
+    The ACU's id from the x-acu-id metadata of a gRPC call. Older clients
+    don't send one and are known by their host instead; the port is left
+    out because they open a new connection, from a new port, per command.
+    """
+    metadata = dict(context.invocation_metadata())
+    if metadata.get('x-acu-id'):
+        return metadata['x-acu-id']
+    peer = context.peer()  # e.g. "ipv4:192.168.1.20:51544" or "ipv6:[::1]:51544"
+    if peer.startswith(("ipv4:", "ipv6:")):
+        return peer.rsplit(':', 1)[0]
+    return peer
+
+def estimate_tokens(text):
+    # Close enough for budgeting: English averages about four characters per token.
+    return len(text) // 4 + 1
+
+def _first_sentence(text, limit=120):
+    sentences = split_sentences(text)
+    first = sentences[0] if sentences else text.strip()
+    return first if len(first) <= limit else first[:limit].rstrip() + "..."
+
+class Session:
+    """The conversation with one ACU: a summary of older turns plus recent ones."""
+
+    def __init__(self, acu_id, token_budget=600, summary_chars=400):
+        self.acu_id = acu_id
+        self.token_budget = token_budget
+        self.summary_chars = summary_chars
+        self.turns = deque()    # (user text, assistant text), oldest first
+        self.summary = deque()  # One line per folded turn, oldest first
+        self.last_used = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _tokens(self):
+        total = sum(estimate_tokens(user) + estimate_tokens(reply) for user, reply in self.turns)
+        return total + sum(estimate_tokens(line) for line in self.summary)
+
+    def _fold_oldest(self):
+        user, reply = self.turns.popleft()
+        self.summary.append(f"Asked: {_first_sentence(user)} Answered: {_first_sentence(reply)}")
+        while sum(len(line) for line in self.summary) > self.summary_chars and len(self.summary) > 1:
+            self.summary.popleft()
+
+    def messages(self, user_text):
+        """The chat messages to send for a new question: summary, recent turns, question."""
+        with self.lock:
+            self.last_used = time.monotonic()
+            messages = []
+            if self.summary:
+                messages.append({"role": "system",
+                                 "content": "Earlier in this conversation: " + " ".join(self.summary)})
+            for user, reply in self.turns:
+                messages.append({"role": "user", "content": user})
+                messages.append({"role": "assistant", "content": reply})
+            messages.append({"role": "user", "content": user_text})
+            return messages
+
+    def add_turn(self, user_text, reply):
+        with self.lock:
+            self.last_used = time.monotonic()
+            self.turns.append((user_text, reply))
+            # Always keep the latest turn verbatim, even if it alone is over budget.
+            while len(self.turns) > 1 and self._tokens() > self.token_budget:
+                self._fold_oldest()
+
+class SessionStore:
+    """Sessions keyed by ACU identity; sessions idle for idle_timeout seconds are dropped."""
+
+    def __init__(self, token_budget=600, summary_chars=400, idle_timeout=15 * 60):
+        self.token_budget = token_budget
+        self.summary_chars = summary_chars
+        self.idle_timeout = idle_timeout
+        self.sessions = {}
+        self.lock = threading.Lock()
+        active_sessions.set_function(lambda: len(self.sessions))
+
+    def get(self, acu_id):
+        with self.lock:
+            session = self.sessions.get(acu_id)
+            if session is None:
+                session = self.sessions[acu_id] = Session(acu_id, self.token_budget, self.summary_chars)
+                print(f"New conversation session for ACU '{acu_id}'.")
+            session.last_used = time.monotonic()
+            return session
+
+    def evict_idle(self):
+        cutoff = time.monotonic() - self.idle_timeout
+        with self.lock:
+            for acu_id in [k for k, s in self.sessions.items() if s.last_used < cutoff]:
+                del self.sessions[acu_id]
+                print(f"Conversation session for ACU '{acu_id}' expired.")
+
+    def start_eviction(self, interval=60):
+        def loop():
+            while True:
+                time.sleep(interval)
+                self.evict_idle()
+        threading.Thread(target=loop, name="session-eviction", daemon=True).start()
@@ -0,0 +1,136 @@
+# Filename: common/audio_cache.py
+# Content-addressed cache of synthesized speech, used by both the TTS server
+# and the Brain so that repeated phrases skip a full XTTS run.
+
+import hashlib
+import os
+import threading
+import wave
+from collections import OrderedDict
+
+def cache_key(text, speaker, language):
+    """Hashes the normalized text together with the voice that rendered it."""
+    normalized = " ".join(text.split()).lower()
+    return hashlib.sha256(f"{speaker}\x00{language}\x00{normalized}".encode('utf-8')).hexdigest()
+
+def load_phrases(path):
+    """Reads a phrase list (one phrase per line, '#' for comments)."""
+    try:
+        with open(path, encoding='utf-8') as f:
+            return [line.strip() for line in f if line.strip() and not line.startswith('#')]
+    except OSError as e:
+        print(f"Could not read phrase list {path}: {e}")
+        return []
+
+class AudioCache:
+    """
+    LRU cache of (sample_rate, 16-bit mono PCM) entries, bounded by total
+    bytes in memory. With a cache_dir, entries are also written to disk as
+    WAV files so they survive restarts; the disk store has its own size bound
+    and evicts the least recently used files.
+    """
+
+    def __init__(self, max_bytes, cache_dir=None, max_disk_bytes=None):
+        self.max_bytes = max_bytes
+        self.cache_dir = cache_dir
+        self.max_disk_bytes = max_disk_bytes
+        self.entries = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.wav")
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry
+        entry = self._read_disk(key)
+        with self.lock:
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._insert(key, entry)
+        return entry
+
+    def put(self, key, sample_rate, pcm):
+        entry = (sample_rate, bytes(pcm))
+        with self.lock:
+            self._insert(key, entry)
+        self._write_disk(key, entry)
+
+    def __contains__(self, key):
+        with self.lock:
+            if key in self.entries:
+                return True
+        return bool(self.cache_dir) and os.path.exists(self._path(key))
+
+    def _insert(self, key, entry):
+        old = self.entries.pop(key, None)
+        if old is not None:
+            self.size -= len(old[1])
+        if len(entry[1]) > self.max_bytes:
+            return
+        self.entries[key] = entry
+        self.size += len(entry[1])
+        while self.size > self.max_bytes:
+            _, evicted = self.entries.popitem(last=False)
+            self.size -= len(evicted[1])
+
+    def _read_disk(self, key):
+        if not self.cache_dir:
+            return None
+        path = self._path(key)
+        try:
+            with wave.open(path, 'rb') as wav_file:
+                entry = (wav_file.getframerate(), wav_file.readframes(wav_file.getnframes()))
+            os.utime(path)  # Mark as recently used for disk eviction
+            return entry
+        except (OSError, EOFError, wave.Error):
+            return None
+
+    def _write_disk(self, key, entry):
+        if not self.cache_dir:
+            return
+        path = self._path(key)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            with wave.open(tmp_path, 'wb') as wav_file:
+                wav_file.setnchannels(1)
+                wav_file.setsampwidth(2)
+                wav_file.setframerate(entry[0])
+                wav_file.writeframes(entry[1])
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"Could not write audio cache entry {path}: {e}")
+            return
+        if self.max_disk_bytes:
+            self._trim_disk()
+
+    def _trim_disk(self):
+        files = []
+        for name in os.listdir(self.cache_dir):
+            if name.endswith('.wav'):
+                stat = os.stat(os.path.join(self.cache_dir, name))
+                files.append((stat.st_mtime, stat.st_size, name))
+        total = sum(size for _, size, _ in files)
+        for _, size, name in sorted(files):
+            if total <= self.max_disk_bytes:
+                break
+            try:
+                os.remove(os.path.join(self.cache_dir, name))
+                total -= size
+            except OSError:
+                pass
+
+    def stats(self):
+        with self.lock:
+            return {"entries": len(self.entries), "bytes": self.size, "hits": self.hits, "misses": self.misses}
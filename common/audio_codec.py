@@ -0,0 +1,57 @@
+# Filename: common/audio_codec.py
+# Opus compression for the ACU -> Brain microphone stream. The ACU encodes its
+# 16 kHz PCM into 20 ms Opus packets and the Brain decodes them back to PCM
+# before Vosk. opuslib (and the libopus it wraps) is optional: without it
+# both sides simply stay on raw PCM.
+
+try:
+    import opuslib
+except ImportError:
+    opuslib = None
+
+OPUS_FRAME_MS = 20        # Opus packets must be 2.5/5/10/20/40/60 ms; 20 ms suits speech
+OPUS_BITRATE = 24000      # Wideband speech at 24 kb/s is transparent for ASR
+MAX_OPUS_FRAME_MS = 120   # Largest frame a single packet can hold
+
+def opus_available():
+    return opuslib is not None
+
+class OpusFrameEncoder:
+    """
+    Encodes a stream of 16-bit mono PCM, arriving in chunks of any size, into
+    fixed-length Opus packets. Leftover samples wait for the next chunk.
+    """
+
+    def __init__(self, sample_rate=16000, frame_ms=OPUS_FRAME_MS, bitrate=OPUS_BITRATE):
+        self.encoder = opuslib.Encoder(sample_rate, 1, opuslib.APPLICATION_VOIP)
+        self.encoder.bitrate = bitrate
+        self.frame_samples = sample_rate * frame_ms // 1000
+        self.frame_bytes = self.frame_samples * 2
+        self.buffer = bytearray()
+
+    def encode(self, pcm):
+        """Adds PCM and returns the packets for every complete frame."""
+        self.buffer.extend(pcm)
+        packets = []
+        while len(self.buffer) >= self.frame_bytes:
+            frame = bytes(self.buffer[:self.frame_bytes])
+            del self.buffer[:self.frame_bytes]
+            packets.append(self.encoder.encode(frame, self.frame_samples))
+        return packets
+
+    def flush(self):
+        """Pads the last partial frame with silence and encodes it."""
+        if not self.buffer:
+            return []
+        self.buffer.extend(b"\x00" * (self.frame_bytes - len(self.buffer)))
+        return self.encode(b"")
+
+class OpusStreamDecoder:
+    """Decodes the packets of one stream back into 16-bit mono PCM."""
+
+    def __init__(self, sample_rate=16000):
+        self.decoder = opuslib.Decoder(sample_rate, 1)
+        self.max_frame_samples = sample_rate * MAX_OPUS_FRAME_MS // 1000
+
+    def decode(self, packets):
+        return b"".join(self.decoder.decode(packet, self.max_frame_samples) for packet in packets)
@@ -0,0 +1,55 @@
+# Filename: common/sentences.py
+# Sentence splitting shared by the Brain and the TTS server, so both sides
+# agree on where one synthesized chunk ends and the next one begins.
+
+import re
+
+# A sentence ends at . ! or ? (optionally followed by closing quotes/brackets)
+# and whitespace, or at a line break. Decimal numbers like "41.5" are not
+# split because the period is not followed by whitespace.
+SENTENCE_BOUNDARY = re.compile(r'(?:(?<=[.!?])|(?<=[.!?]["\')\]]))\s+|\n+')
+
+# Very short fragments ("Okay.") sound choppy on their own, so they are
+# merged into the following sentence.
+MIN_SENTENCE_CHARS = 12
+
+class SentenceSegmenter:
+    """
+    Splits text that arrives in pieces (e.g. streamed LLM tokens) into
+    sentences, returning each one as soon as the boundary after it is seen.
+    """
+
+    def __init__(self):
+        self.buffer = ""
+
+    def feed(self, text):
+        """Adds text and returns the list of sentences it completed."""
+        self.buffer += text
+        sentences = []
+        start = 0
+        for match in SENTENCE_BOUNDARY.finditer(self.buffer):
+            candidate = self.buffer[start:match.start()].strip()
+            if len(candidate) < MIN_SENTENCE_CHARS:
+                continue  # Too short; let it run on into the next sentence
+            sentences.append(" ".join(candidate.split()))
+            start = match.end()
+        self.buffer = self.buffer[start:]
+        return sentences
+
+    def flush(self):
+        """Returns whatever is left once the text is complete."""
+        tail = " ".join(self.buffer.split())
+        self.buffer = ""
+        return tail
+
+def split_sentences(text):
+    """Splits text into sentences suitable for one TTS call each."""
+    segmenter = SentenceSegmenter()
+    sentences = segmenter.feed(text)
+    tail = segmenter.flush()
+    if tail:
+        if sentences and len(tail) < MIN_SENTENCE_CHARS:
+            sentences[-1] = f"{sentences[-1]} {tail}"
+        else:
+            sentences.append(tail)
+    return sentences
@@ -0,0 +1,64 @@
+# Filename: common/tracing.py
+# Request tracing across the ACU, the Brain and the TTS server. The ACU starts
+# a trace when it hears the wake word and sends its id and start time as gRPC
+# metadata; the Brain records when the request reaches each stage and passes
+# the id to the TTS server as X-Request-ID, so the logs of all three machines
+# can be lined up. Times are wall-clock, so intervals measured across two
+# machines (e.g. wake word -> first byte on the Brain) assume NTP-synced clocks.
+
+import threading
+import time
+import uuid
+
+REQUEST_ID_KEY = 'x-request-id'
+WAKE_TIME_KEY = 'x-wake-time'
+
+def new_request_id():
+    return uuid.uuid4().hex[:12]
+
+class Trace:
+    """
+    The milestones of one request, by name. Only the first time a request
+    reaches a milestone is kept, so marking from several threads is safe.
+    """
+
+    def __init__(self, request_id=None, started_at=None):
+        self.request_id = request_id or new_request_id()
+        self.from_acu = started_at is not None  # True when the start is the ACU's wake word
+        self.started_at = time.time() if started_at is None else started_at
+        self.spans = {}
+        self.lock = threading.Lock()
+
+    @classmethod
+    def from_metadata(cls, metadata):
+        """Continues the ACU's trace from gRPC metadata (a dict), or starts a new one."""
+        try:
+            started_at = float(metadata[WAKE_TIME_KEY])
+        except (KeyError, ValueError):
+            started_at = None
+        return cls(metadata.get(REQUEST_ID_KEY), started_at)
+
+    def metadata(self):
+        return ((REQUEST_ID_KEY, self.request_id), (WAKE_TIME_KEY, f"{self.started_at:.6f}"))
+
+    def mark(self, name):
+        """Records that the request reached a milestone now. Returns False if it already had."""
+        with self.lock:
+            if name in self.spans:
+                return False
+            self.spans[name] = time.time()
+            return True
+
+    def elapsed(self, start, end):
+        """Seconds between two milestones ("start" is the trace start), or None if either is missing."""
+        begin = self.started_at if start == "start" else self.spans.get(start)
+        finish = self.spans.get(end)
+        if begin is None or finish is None:
+            return None
+        return max(0.0, finish - begin)
+
+    def summary(self):
+        with self.lock:
+            spans = sorted(self.spans.items(), key=lambda span: span[1])
+        steps = ", ".join(f"{name} +{at - self.started_at:.3f}s" for name, at in spans)
+        return f"[{self.request_id}] {steps}"
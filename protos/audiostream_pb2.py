@@ -24,17 +24,35 @@ _sym_db = _symbol_database.Default()
 
 
 
-DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(b'\n\x11\x61udiostream.proto\"!\n\nAudioChunk\x12\x13\n\x0b\x61udio_chunk\x18\x01 \x01(\x0c\"\'\n\rStreamReceipt\x12\x16\n\x0estatus_message\x18\x01 \x01(\t2?\n\rAudioStreamer\x12.\n\x0bStreamAudio\x12\x0b.AudioChunk\x1a\x0e.StreamReceipt\"\x00(\x01\x62\x06proto3')
+DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(b'\n\x11\x61udiostream.proto\"\x95\x01\n\nAudioChunk\x12\x13\n\x0b\x61udio_chunk\x18\x01 \x01(\x0c\x12\x1a\n\x05\x63odec\x18\x02 \x01(\x0e\x32\x0b.AudioCodec\x12\x14\n\x0copus_packets\x18\x03 \x03(\x0c\x12\x16\n\x03vad\x18\x04 \x01(\x0e\x32\t.VadState\x12\x14\n\x0cspeech_start\x18\x05 \x01(\x08\x12\x12\n\nspeech_end\x18\x06 \x01(\x08\"\x15\n\x13\x43\x61pabilitiesRequest\"@\n\x0c\x43\x61pabilities\x12\x1b\n\x06\x63odecs\x18\x01 \x03(\x0e\x32\x0b.AudioCodec\x12\x13\n\x0bsample_rate\x18\x02 \x01(\x05\"\'\n\rStreamReceipt\x12\x16\n\x0estatus_message\x18\x01 \x01(\t\"1\n\x0fTranscriptEvent\x12\x0c\n\x04text\x18\x01 \x01(\t\x12\x10\n\x08is_final\x18\x02 \x01(\x08\"\xa1\x01\n\x0bStatusEvent\x12!\n\x05state\x18\x01 \x01(\x0e\x32\x12.StatusEvent.State\x12\x0f\n\x07message\x18\x02 \x01(\t\"^\n\x05State\x12\x0b\n\x07UNKNOWN\x10\x00\x12\x15\n\x11\x45NDPOINT_DETECTED\x10\x01\x12\x0e\n\nPROCESSING\x10\x02\x12\x0c\n\x08SPEAKING\x10\x03\x12\x08\n\x04\x44ONE\x10\x04\x12\t\n\x05\x45RROR\x10\x05\".\n\nAudioFrame\x12\x0b\n\x03pcm\x18\x01 \x01(\x0c\x12\x13\n\x0bsample_rate\x18\x02 \x01(\x05\"|\n\x0bServerEvent\x12&\n\ntranscript\x18\x01 \x01(\x0b\x32\x10.TranscriptEventH\x00\x12\x1e\n\x06status\x18\x02 \x01(\x0b\x32\x0c.StatusEventH\x00\x12\x1c\n\x05\x61udio\x18\x03 \x01(\x0b\x32\x0b.AudioFrameH\x00\x42\x07\n\x05\x65vent*%\n\nAudioCodec\x12\r\n\tPCM_S16LE\x10\x00\x12\x08\n\x04OPUS\x10\x01*<\n\x08VadState\x12\x0f\n\x0bVAD_UNKNOWN\x10\x00\x12\x0e\n\nVAD_SPEECH\x10\x01\x12\x0f\n\x0bVAD_SILENCE\x10\x02\x32\xa6\x01\n\rAudioStreamer\x12.\n\x0bStreamAudio\x12\x0b.AudioChunk\x1a\x0e.StreamReceipt\"\x00(\x01\x12+\n\x08\x43onverse\x12\x0b.AudioChunk\x1a\x0c.ServerEvent\"\x00(\x01\x30\x01\x12\x38\n\x0fGetCapabilities\x12\x14.CapabilitiesRequest\x1a\r.Capabilities\"\x00\x62\x06proto3')
 
 _globals = globals()
 _builder.BuildMessageAndEnumDescriptors(DESCRIPTOR, _globals)
 _builder.BuildTopDescriptorsAndMessages(DESCRIPTOR, 'audiostream_pb2', _globals)
 if not _descriptor._USE_C_DESCRIPTORS:
   DESCRIPTOR._loaded_options = None
-  _globals['_AUDIOCHUNK']._serialized_start=21
-  _globals['_AUDIOCHUNK']._serialized_end=54
-  _globals['_STREAMRECEIPT']._serialized_start=56
-  _globals['_STREAMRECEIPT']._serialized_end=95
-  _globals['_AUDIOSTREAMER']._serialized_start=97
-  _globals['_AUDIOSTREAMER']._serialized_end=160
+  _globals['_AUDIOCODEC']._serialized_start=692
+  _globals['_AUDIOCODEC']._serialized_end=729
+  _globals['_VADSTATE']._serialized_start=731
+  _globals['_VADSTATE']._serialized_end=791
+  _globals['_AUDIOCHUNK']._serialized_start=22
+  _globals['_AUDIOCHUNK']._serialized_end=171
+  _globals['_CAPABILITIESREQUEST']._serialized_start=173
+  _globals['_CAPABILITIESREQUEST']._serialized_end=194
+  _globals['_CAPABILITIES']._serialized_start=196
+  _globals['_CAPABILITIES']._serialized_end=260
+  _globals['_STREAMRECEIPT']._serialized_start=262
+  _globals['_STREAMRECEIPT']._serialized_end=301
+  _globals['_TRANSCRIPTEVENT']._serialized_start=303
+  _globals['_TRANSCRIPTEVENT']._serialized_end=352
+  _globals['_STATUSEVENT']._serialized_start=355
+  _globals['_STATUSEVENT']._serialized_end=516
+  _globals['_STATUSEVENT_STATE']._serialized_start=422
+  _globals['_STATUSEVENT_STATE']._serialized_end=516
+  _globals['_AUDIOFRAME']._serialized_start=518
+  _globals['_AUDIOFRAME']._serialized_end=564
+  _globals['_SERVEREVENT']._serialized_start=566
+  _globals['_SERVEREVENT']._serialized_end=690
+  _globals['_AUDIOSTREAMER']._serialized_start=794
+  _globals['_AUDIOSTREAMER']._serialized_end=960
 # @@protoc_insertion_point(module_scope)
@@ -40,6 +40,16 @@ class AudioStreamerStub(object):
                 request_serializer=audiostream__pb2.AudioChunk.SerializeToString,
                 response_deserializer=audiostream__pb2.StreamReceipt.FromString,
                 _registered_method=True)
+        self.Converse = channel.stream_stream(
+                '/AudioStreamer/Converse',
+                request_serializer=audiostream__pb2.AudioChunk.SerializeToString,
+                response_deserializer=audiostream__pb2.ServerEvent.FromString,
+                _registered_method=True)
+        self.GetCapabilities = channel.unary_unary(
+                '/AudioStreamer/GetCapabilities',
+                request_serializer=audiostream__pb2.CapabilitiesRequest.SerializeToString,
+                response_deserializer=audiostream__pb2.Capabilities.FromString,
+                _registered_method=True)
 
 
 class AudioStreamerServicer(object):
@@ -49,6 +59,22 @@ class AudioStreamerServicer(object):
     def StreamAudio(self, request_iterator, context):
         """A client-streaming RPC. The client sends a stream of AudioChunk messages.
         The server responds with a single StreamReceipt when the client is done.
+        The reply is played on the Brain's own speaker.
+        """
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def Converse(self, request_iterator, context):
+        """A bidirectional RPC. The client sends AudioChunk messages and receives
+        transcript, status and reply audio events, so it can play the reply itself.
+        """
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def GetCapabilities(self, request, context):
+        """Lets the ACU negotiate its audio codec before streaming.
         """
         context.set_code(grpc.StatusCode.UNIMPLEMENTED)
         context.set_details('Method not implemented!')
@@ -62,6 +88,16 @@ def add_AudioStreamerServicer_to_server(servicer, server):
                     request_deserializer=audiostream__pb2.AudioChunk.FromString,
                     response_serializer=audiostream__pb2.StreamReceipt.SerializeToString,
             ),
+            'Converse': grpc.stream_stream_rpc_method_handler(
+                    servicer.Converse,
+                    request_deserializer=audiostream__pb2.AudioChunk.FromString,
+                    response_serializer=audiostream__pb2.ServerEvent.SerializeToString,
+            ),
+            'GetCapabilities': grpc.unary_unary_rpc_method_handler(
+                    servicer.GetCapabilities,
+                    request_deserializer=audiostream__pb2.CapabilitiesRequest.FromString,
+                    response_serializer=audiostream__pb2.Capabilities.SerializeToString,
+            ),
     }
     generic_handler = grpc.method_handlers_generic_handler(
             'AudioStreamer', rpc_method_handlers)
@@ -100,3 +136,57 @@ class AudioStreamer(object):
             timeout,
             metadata,
             _registered_method=True)
+
+    @staticmethod
+    def Converse(request_iterator,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.stream_stream(
+            request_iterator,
+            target,
+            '/AudioStreamer/Converse',
+            audiostream__pb2.AudioChunk.SerializeToString,
+            audiostream__pb2.ServerEvent.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
+
+    @staticmethod
+    def GetCapabilities(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(
+            request,
+            target,
+            '/AudioStreamer/GetCapabilities',
+            audiostream__pb2.CapabilitiesRequest.SerializeToString,
+            audiostream__pb2.Capabilities.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
@@ -0,0 +1,51 @@
+# Filename: tests/test_pipeline.py
+# Run from the project root: python -m unittest discover tests
+
+import os
+import sys
+import threading
+import unittest
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.join(PROJECT_ROOT, 'brain_jetson'))
+sys.path.append(os.path.join(PROJECT_ROOT, 'common'))
+
+from admission import AdmissionController
+from intents import LLM
+from pipeline import Job, Stage
+
+class StageCancellationTest(unittest.TestCase):
+    def admitted_job(self, admission):
+        job = Job("tell me about black holes", play_locally=False)
+        self.assertTrue(admission.admit_job(LLM))
+        job.on_done(lambda job: admission.release_job(LLM))
+        return job
+
+    def test_cancel_during_handler_releases_admission_slot(self):
+        admission = AdmissionController(4, 2, {LLM: 1})
+        job = self.admitted_job(admission)
+        finished = threading.Event()
+        job.on_done(lambda job: finished.set())
+        # The handler stands in for a barge-in arriving mid-generation.
+        stage = Stage("generation", lambda job: job.cancel())
+        stage.put(job)
+
+        self.assertTrue(finished.wait(2.0))
+        self.assertIsNone(job.sentences.get(timeout=1.0))
+        self.assertTrue(admission.admit_job(LLM))
+
+    def test_cancel_while_queued_releases_admission_slot(self):
+        admission = AdmissionController(4, 2, {LLM: 1})
+        job = self.admitted_job(admission)
+        finished = threading.Event()
+        job.on_done(lambda job: finished.set())
+        ran = []
+        job.cancel()
+        Stage("generation", ran.append).put(job)
+
+        self.assertTrue(finished.wait(2.0))
+        self.assertEqual(ran, [])
+        self.assertTrue(admission.admit_job(LLM))
+
+if __name__ == "__main__":
+    unittest.main()
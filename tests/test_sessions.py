@@ -0,0 +1,45 @@
+# Filename: tests/test_sessions.py
+# Run from the project root: python -m unittest discover tests
+
+import os
+import sys
+import unittest
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.join(PROJECT_ROOT, 'brain_jetson'))
+sys.path.append(os.path.join(PROJECT_ROOT, 'common'))
+
+from sessions import acu_identity
+
+class FakeContext:
+    """The two grpc.ServicerContext methods acu_identity uses."""
+
+    def __init__(self, peer, metadata=()):
+        self._peer = peer
+        self.metadata = metadata
+
+    def peer(self):
+        return self._peer
+
+    def invocation_metadata(self):
+        return self.metadata
+
+class AcuIdentityTest(unittest.TestCase):
+    def test_metadata_id_wins(self):
+        context = FakeContext("ipv4:192.168.1.20:51544", (('x-acu-id', 'kitchen'),))
+        self.assertEqual(acu_identity(context), "kitchen")
+
+    def test_legacy_client_keeps_its_identity_across_connections(self):
+        first = acu_identity(FakeContext("ipv4:192.168.1.20:51544"))
+        second = acu_identity(FakeContext("ipv4:192.168.1.20:51990"))
+        self.assertEqual(first, "ipv4:192.168.1.20")
+        self.assertEqual(first, second)
+
+    def test_ipv6_peer_drops_only_the_port(self):
+        self.assertEqual(acu_identity(FakeContext("ipv6:[fe80::1]:51544")), "ipv6:[fe80::1]")
+
+    def test_unix_socket_peer_is_kept_whole(self):
+        self.assertEqual(acu_identity(FakeContext("unix:/tmp/brain.sock")), "unix:/tmp/brain.sock")
+
+if __name__ == "__main__":
+    unittest.main()
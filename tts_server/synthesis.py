@@ -0,0 +1,150 @@
+# filename: tts_server/synthesis.py
+# Request queue in front of the XTTS model. The model is not safe to call from
+# several threads, so one worker owns it and every HTTP request submits its
+# sentences here. The worker micro-batches whatever is pending: it takes the
+# next sentence of each active request in turn, renders identical sentences
+# only once, and hands each result back to the request that asked for it.
+
+import logging
+import threading
+import time
+import traceback
+
+class SynthesisRequest:
+    """The sentences of one HTTP request and their rendered PCM, in order."""
+
+    def __init__(self, request_id, sentences, voice):
+        self.request_id = request_id
+        self.sentences = sentences
+        self.voice = voice
+        self.results = [None] * len(sentences)
+        self.next_index = 0  # Next sentence the worker has not claimed yet
+        self.error = None
+        self.cancelled = False
+        self.cond = threading.Condition()
+
+    def claim_next(self):
+        """Returns the index of the next sentence to render, or None when all are claimed."""
+        while self.next_index < len(self.sentences):
+            index = self.next_index
+            self.next_index += 1
+            if self.results[index] is None:
+                return index
+        return None
+
+    def has_unclaimed(self):
+        return any(r is None for r in self.results[self.next_index:])
+
+    def deliver(self, index, pcm):
+        with self.cond:
+            self.results[index] = pcm
+            self.cond.notify_all()
+
+    def fail(self, error):
+        with self.cond:
+            self.error = error
+            self.cond.notify_all()
+
+    def cancel(self):
+        """Called when the client goes away; unrendered sentences are skipped."""
+        with self.cond:
+            self.cancelled = True
+            self.cond.notify_all()
+
+    def __iter__(self):
+        """Yields each sentence's PCM as soon as it (and every earlier one) is ready."""
+        for index in range(len(self.sentences)):
+            with self.cond:
+                while self.results[index] is None and self.error is None and not self.cancelled:
+                    self.cond.wait()
+                if self.error is not None:
+                    raise self.error
+                if self.cancelled:
+                    return
+                pcm = self.results[index]
+            yield pcm
+
+class SynthesisScheduler:
+    """
+    Owns the model on a single worker thread. render(text, voice) turns a
+    sentence into PCM; lookup(text, voice) returns cached PCM or None, so
+    cache hits are answered at submit time without waiting behind other
+    requests.
+    """
+
+    def __init__(self, render, lookup=None, batch_window=0.02, max_batch=4):
+        self.render = render
+        self.lookup = lookup
+        self.batch_window = batch_window
+        self.max_batch = max_batch
+        self.active = []
+        self.cond = threading.Condition()
+        threading.Thread(target=self._run, name="tts-synthesis", daemon=True).start()
+
+    def submit(self, request_id, sentences, voice):
+        request = SynthesisRequest(request_id, sentences, voice)
+        if self.lookup:
+            for index, sentence in enumerate(sentences):
+                request.results[index] = self.lookup(sentence, voice)
+        if request.has_unclaimed():
+            with self.cond:
+                self.active.append(request)
+                self.cond.notify()
+        return request
+
+    def pending_sentences(self):
+        """Sentences not yet claimed by the worker (cache hits don't count)."""
+        with self.cond:
+            return sum(r.results[r.next_index:].count(None) for r in self.active)
+
+    def active_requests(self):
+        with self.cond:
+            return len(self.active)
+
+    def _take_batch(self):
+        with self.cond:
+            was_idle = not self.active
+            while not self.active:
+                self.cond.wait()
+        if was_idle:
+            # Give requests that arrive at the same moment a chance to join the batch.
+            time.sleep(self.batch_window)
+
+        with self.cond:
+            batch = []
+            served = []
+            for request in list(self.active):
+                if len(batch) >= self.max_batch:
+                    break
+                index = None if request.cancelled or request.error else request.claim_next()
+                if index is None:
+                    self.active.remove(request)
+                    continue
+                batch.append((request, index))
+                served.append(request)
+            # Served requests go to the back so the next batch starts with the others.
+            for request in served:
+                if request in self.active:
+                    self.active.remove(request)
+                    if request.has_unclaimed():
+                        self.active.append(request)
+            return batch
+
+    def _run(self):
+        while True:
+            batch = self._take_batch()
+            rendered = {}
+            for request, index in batch:
+                text = request.sentences[index]
+                normalized = (request.voice, " ".join(text.split()).lower())
+                try:
+                    if normalized not in rendered:
+                        start_time = time.monotonic()
+                        rendered[normalized] = self.render(text, request.voice)
+                        logging.info(f"[{request.request_id}] Rendered sentence {index + 1}/{len(request.sentences)} "
+                                     f"in {time.monotonic() - start_time:.2f}s (batch of {len(batch)}).")
+                    request.deliver(index, rendered[normalized])
+                except Exception as e:
+                    logging.error(f"[{request.request_id}] TTS synthesis failed on sentence {index + 1}: {e}")
+                    traceback.print_exc()
+                    request.fail(e)
@@ -1,15 +1,41 @@
 # filename: tts_server/tts_app.py
+import io
 import os
+import sys
+import time
+import wave
 import traceback
-from flask import Flask, request, send_file, jsonify
+from flask import Flask, request, send_file, jsonify, Response, stream_with_context
 from TTS.api import TTS
+import numpy as np
 import torch
 import logging
 
+# --- Add common directory to path ---
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(os.path.join(PROJECT_ROOT, 'common'))
+
+from sentences import split_sentences
+from audio_cache import AudioCache, cache_key, load_phrases
+from metrics import REGISTRY
+from tracing import new_request_id
+from synthesis import SynthesisScheduler
+from voices import VoiceStore
+
 logging.basicConfig(level=logging.INFO)
 app = Flask(__name__)
 PORT = 5002
-OUTPUT_FILENAME = "output.wav"
+LANGUAGE = 'en'
+CACHE_DIR = os.getenv("TTS_CACHE_DIR", os.path.join(os.path.dirname(__file__), 'cache'))
+CACHE_MEMORY_BYTES = 64 * 1024 * 1024
+CACHE_DISK_BYTES = 512 * 1024 * 1024
+VOICES_DIR = os.getenv("TTS_VOICES_DIR", os.path.join(os.path.dirname(__file__), 'voices'))
+VOICE_STORE_PATH = os.path.join(CACHE_DIR, 'voice_latents.pt')
+# Extra built-in XTTS speakers to precompute, comma separated
+PRELOAD_SPEAKERS = [name.strip() for name in os.getenv("TTS_PRELOAD_SPEAKERS", "").split(",") if name.strip()]
+BATCH_WINDOW_SECONDS = 0.02  # How long the worker waits for concurrent requests to join a batch
+MAX_BATCH_SENTENCES = 4
+PRERENDER_PHRASES_FILE = os.getenv("TTS_PRERENDER_PHRASES", os.path.join(PROJECT_ROOT, 'common', 'common_phrases.txt'))
 
 device = "cuda" if torch.cuda.is_available() else "cpu"
 logging.info(f"TTS running on device: {device}")
@@ -23,43 +49,186 @@ logging.info("TTS model loaded successfully.")
 available_speakers = list(tts.synthesizer.tts_speakers.keys())
 # Select the first available speaker as our default voice
 default_speaker = available_speakers[0]
-logging.info(f"Default speaker set to: {default_speaker}")
+OUTPUT_SAMPLE_RATE = tts.synthesizer.output_sample_rate
 
+# Precompute the conditioning latents and speaker embeddings for every
+# configured voice, so inference can be fed them directly.
+xtts = tts.synthesizer.tts_model
+os.makedirs(CACHE_DIR, exist_ok=True)
+voices = VoiceStore(xtts, VOICE_STORE_PATH)
+for speaker_name in [default_speaker] + PRELOAD_SPEAKERS:
+    voices.add_builtin(speaker_name)
+voices.add_directory(VOICES_DIR)
+voices.save()
+default_voice = os.getenv("TTS_DEFAULT_VOICE", default_speaker)
+if default_voice not in voices:
+    logging.warning(f"Voice '{default_voice}' is not available, falling back to '{default_speaker}'.")
+    default_voice = default_speaker
+logging.info(f"Default voice set to: {default_voice} (available: {', '.join(voices.names())})")
 
-@app.route('/api/tts', methods=['POST'])
-def generate_speech():
-    data = request.get_json()
+# Sampling settings from the model config, as tts.tts() would use them
+INFERENCE_SETTINGS = {key: getattr(xtts.config, key)
+                      for key in ("temperature", "length_penalty", "repetition_penalty", "top_k", "top_p")
+                      if hasattr(xtts.config, key)}
+
+audio_cache = AudioCache(CACHE_MEMORY_BYTES, CACHE_DIR, CACHE_DISK_BYTES)
+
+render_seconds = REGISTRY.histogram("tts_render_seconds", "XTTS inference time per sentence (cache misses only).")
+first_audio_seconds = REGISTRY.histogram("tts_first_audio_seconds", "Streaming request received to the first PCM sent back.")
+request_seconds = REGISTRY.histogram("tts_request_seconds", "Request received to the last PCM sent back, by endpoint.")
+
+
+def cached_pcm(text, voice):
+    """Returns cached PCM for a sentence, or None."""
+    cached = audio_cache.get(cache_key(text, voice, LANGUAGE))
+    return cached[1] if cached is not None else None
+
+
+def render_pcm(text, voice):
+    """
+    Renders one sentence in memory and returns it as 16-bit mono PCM bytes.
+    Only the synthesis worker calls this; results are cached by text,
+    voice and language.
+    """
+    pcm = cached_pcm(text, voice)
+    if pcm is not None:
+        return pcm
+
+    gpt_cond_latent, speaker_embedding = voices.get(voice)
+    start_time = time.monotonic()
+    out = xtts.inference(text, LANGUAGE, gpt_cond_latent, speaker_embedding,
+                         enable_text_splitting=False, **INFERENCE_SETTINGS)
+    render_seconds.observe(time.monotonic() - start_time)
+    wav = out["wav"]
+    if torch.is_tensor(wav):
+        wav = wav.cpu().numpy()
+    samples = np.clip(np.asarray(wav, dtype=np.float32), -1.0, 1.0)
+    pcm = (samples * 32767).astype('<i2').tobytes()
+    audio_cache.put(cache_key(text, voice, LANGUAGE), OUTPUT_SAMPLE_RATE, pcm)
+    return pcm
+
+
+def prerender_phrases(path):
+    """Renders the configured phrase list into the cache, sentence by sentence."""
+    phrases = load_phrases(path)
+    for phrase in phrases:
+        for sentence in split_sentences(phrase):
+            render_pcm(sentence, default_voice)
+    logging.info(f"Pre-rendered {len(phrases)} phrase(s); cache: {audio_cache.stats()}")
+
+
+def pcm_to_wav(pcm):
+    """Wraps PCM in a WAV container, in memory."""
+    buffer = io.BytesIO()
+    with wave.open(buffer, 'wb') as wav_file:
+        wav_file.setnchannels(1)
+        wav_file.setsampwidth(2)
+        wav_file.setframerate(OUTPUT_SAMPLE_RATE)
+        wav_file.writeframes(pcm)
+    buffer.seek(0)
+    return buffer
+
+
+def parse_request():
+    """Returns (request_id, sentences, voice) for a TTS request, or an error response."""
+    data = request.get_json(silent=True)
     if not data or 'text' not in data:
-        return jsonify({"error": "No text provided"}), 400
+        return None, (jsonify({"error": "No text provided"}), 400)
+    sentences = split_sentences(data['text'])
+    if not sentences:
+        return None, (jsonify({"error": "No text provided"}), 400)
+    voice = data.get('speaker') or default_voice
+    if voice not in voices:
+        return None, (jsonify({"error": f"Unknown speaker '{voice}'"}), 400)
+    request_id = request.headers.get('X-Request-ID') or new_request_id()
+    return (request_id, sentences, voice), None
 
-    text_to_speak = data['text']
-    logging.info(f"Received request to synthesize: '{text_to_speak}'")
 
-    try:
-        if os.path.exists(OUTPUT_FILENAME):
-            os.remove(OUTPUT_FILENAME)
-
-        # CORRECTED API CALL: Using the default speaker key from the dictionary.
-        tts.tts_to_file(
-            text=text_to_speak,
-            file_path=OUTPUT_FILENAME,
-            speaker=default_speaker,
-            language='en'
-        )
+prerender_phrases(PRERENDER_PHRASES_FILE)
+scheduler = SynthesisScheduler(render_pcm, lookup=cached_pcm,
+                               batch_window=BATCH_WINDOW_SECONDS, max_batch=MAX_BATCH_SENTENCES)
+REGISTRY.gauge("tts_pending_sentences", "Sentences waiting for the synthesis worker.").set_function(scheduler.pending_sentences)
+REGISTRY.gauge("tts_active_requests", "Requests with sentences still to render.").set_function(scheduler.active_requests)
+
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    return Response(REGISTRY.render(), mimetype="text/plain; version=0.0.4")
+
+
+@app.route('/api/voices', methods=['GET'])
+def list_voices():
+    return jsonify({"default": default_voice, "voices": voices.names()})
+
 
-        if not os.path.exists(OUTPUT_FILENAME):
-            return jsonify({"error": "TTS failed to generate audio file"}), 500
-        
-        return send_file(
-            OUTPUT_FILENAME,
+@app.route('/api/tts', methods=['POST'])
+def generate_speech():
+    start_time = time.monotonic()
+    parsed, error = parse_request()
+    if error:
+        return error
+    request_id, sentences, voice = parsed
+    logging.info(f"[{request_id}] Received request to synthesize {len(sentences)} sentence(s).")
+
+    try:
+        pcm = b''.join(scheduler.submit(request_id, sentences, voice))
+        elapsed = time.monotonic() - start_time
+        request_seconds.observe(elapsed, endpoint="tts")
+        logging.info(f"[{request_id}] Rendered in {elapsed:.2f}s.")
+        response = send_file(
+            pcm_to_wav(pcm),
             mimetype="audio/wav",
             as_attachment=True,
             download_name="response.wav"
         )
+        response.headers["X-Request-ID"] = request_id
+        return response
     except Exception as e:
-        logging.error(f"An error occurred during TTS synthesis: {e}")
+        logging.error(f"[{request_id}] An error occurred during TTS synthesis: {e}")
         traceback.print_exc()
         return jsonify({"error": "An internal server error occurred"}), 500
 
+
+@app.route('/api/tts/stream', methods=['POST'])
+def stream_speech():
+    """
+    Streams raw PCM (s16le, mono) sentence by sentence over a chunked
+    response, so the client can start playing the first sentence while
+    the rest of the utterance is still being rendered.
+    """
+    start_time = time.monotonic()
+    parsed, error = parse_request()
+    if error:
+        return error
+    request_id, sentences, voice = parsed
+    logging.info(f"[{request_id}] Received streaming request with {len(sentences)} sentence(s).")
+    synthesis = scheduler.submit(request_id, sentences, voice)
+
+    def generate():
+        first = True
+        try:
+            for pcm in synthesis:
+                if first:
+                    elapsed = time.monotonic() - start_time
+                    first_audio_seconds.observe(elapsed, endpoint="stream")
+                    logging.info(f"[{request_id}] First audio after {elapsed:.2f}s.")
+                    first = False
+                yield pcm
+            request_seconds.observe(time.monotonic() - start_time, endpoint="stream")
+        except Exception as e:
+            # Headers are already sent, so the best we can do is end the stream early.
+            logging.error(f"[{request_id}] Ending stream early: {e}")
+        finally:
+            # Runs on normal completion and when the client disconnects.
+            synthesis.cancel()
+
+    headers = {
+        "X-Request-ID": request_id,
+        "X-Sample-Rate": str(OUTPUT_SAMPLE_RATE),
+        "X-Channels": "1",
+        "X-Sample-Format": "s16le",
+    }
+    return Response(stream_with_context(generate()), mimetype="application/octet-stream", headers=headers)
+
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=PORT, debug=False)
\ No newline at end of file
+    app.run(host='0.0.0.0', port=PORT, debug=False, threaded=True)
\ No newline at end of file
@@ -0,0 +1,115 @@
+# filename: tts_server/voices.py
+# Precomputed XTTS speaker conditioning. Computing the GPT conditioning latent
+# and speaker embedding from reference audio is a large share of the cost of
+# a short utterance, so it is done once per voice at startup, kept in memory,
+# and persisted to disk so restarts don't pay for it again.
+
+import hashlib
+import logging
+import os
+
+import torch
+
+REFERENCE_EXTENSIONS = ('.wav', '.flac', '.mp3')
+
+def _fingerprint(paths):
+    """Identifies a set of reference files by name, size and modification time."""
+    digest = hashlib.sha256()
+    for path in sorted(paths):
+        stat = os.stat(path)
+        digest.update(f"{os.path.basename(path)}:{stat.st_size}:{stat.st_mtime_ns}".encode('utf-8'))
+    return digest.hexdigest()
+
+class VoiceStore:
+    """
+    Maps a voice name to its (gpt_cond_latent, speaker_embedding) tensors.
+    Voices are either XTTS's built-in speakers or custom voices built from
+    reference recordings.
+    """
+
+    def __init__(self, model, store_path=None):
+        self.model = model  # The Xtts model, i.e. tts.synthesizer.tts_model
+        self.store_path = store_path
+        self.voices = {}
+        self.fingerprints = {}
+        self.persisted = self._load()
+
+    def _load(self):
+        if not self.store_path or not os.path.exists(self.store_path):
+            return {}
+        try:
+            return torch.load(self.store_path, map_location='cpu')
+        except Exception as e:
+            logging.warning(f"Could not read voice store {self.store_path}, recomputing voices: {e}")
+            return {}
+
+    def save(self):
+        if not self.store_path:
+            return
+        data = {
+            name: {
+                "fingerprint": self.fingerprints.get(name),
+                "gpt_cond_latent": latent.cpu(),
+                "speaker_embedding": embedding.cpu(),
+            }
+            for name, (latent, embedding) in self.voices.items()
+        }
+        tmp_path = f"{self.store_path}.tmp"
+        torch.save(data, tmp_path)
+        os.replace(tmp_path, self.store_path)
+
+    def _store(self, name, latent, embedding, fingerprint=None):
+        device = next(self.model.parameters()).device
+        self.voices[name] = (latent.to(device), embedding.to(device))
+        self.fingerprints[name] = fingerprint
+
+    def add_builtin(self, name):
+        """Registers one of the speakers shipped with XTTS."""
+        speaker = self.model.speaker_manager.speakers[name]
+        self._store(name, speaker["gpt_cond_latent"], speaker["speaker_embedding"])
+
+    def add_reference(self, name, paths):
+        """Registers a custom voice, computing its latents unless a persisted copy is current."""
+        fingerprint = _fingerprint(paths)
+        saved = self.persisted.get(name)
+        if saved and saved.get("fingerprint") == fingerprint:
+            self._store(name, saved["gpt_cond_latent"], saved["speaker_embedding"], fingerprint)
+            logging.info(f"Loaded precomputed latents for voice '{name}'.")
+            return
+        logging.info(f"Computing conditioning latents for voice '{name}' from {len(paths)} file(s)...")
+        latent, embedding = self.model.get_conditioning_latents(audio_path=paths)
+        self._store(name, latent, embedding, fingerprint)
+
+    def add_directory(self, voices_dir):
+        """
+        Registers every custom voice in voices_dir: a single file is a voice
+        named after the file, a subdirectory is a voice built from all its files.
+        """
+        if not voices_dir or not os.path.isdir(voices_dir):
+            return
+        for entry in sorted(os.listdir(voices_dir)):
+            path = os.path.join(voices_dir, entry)
+            if os.path.isdir(path):
+                paths = [os.path.join(path, f) for f in sorted(os.listdir(path))
+                         if f.lower().endswith(REFERENCE_EXTENSIONS)]
+                name = entry
+            elif entry.lower().endswith(REFERENCE_EXTENSIONS):
+                paths = [path]
+                name = os.path.splitext(entry)[0]
+            else:
+                continue
+            if not paths:
+                continue
+            try:
+                self.add_reference(name, paths)
+            except Exception as e:
+                logging.error(f"Could not build voice '{name}': {e}")
+
+    def get(self, name):
+        return self.voices[name]
+
+    def __contains__(self, name):
+        return name in self.voices
+
+    def names(self):
+        return list(self.voices)